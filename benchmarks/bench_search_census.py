@@ -0,0 +1,254 @@
+"""
+End-to-end benchmark of the search_census pipeline with local stand-ins.
+
+Synthetic block group polygons are written to an in-process spatial index
+(SPATIAL_ENGINE=local) and ACS responses are served by a local HTTP stand-in
+for api.census.gov, so no MongoDB, network or API key is needed.
+
+For every combination of radius, point count and table count it times each
+stage (block group search, Census fetch with a cold and a warm cache,
+aggregation, pivot, highlight serialization), then records peak traced memory
+in a separate pass so tracing does not slow the timed one. Like Get Data, all
+tables are fetched in one fetch_census_tables call. total counts the cold
+fetch and total_warm the warm one.
+Results are written as JSON lines tagged with the current commit, so runs can
+be compared across commits.
+
+Usage: python benchmarks/bench_search_census.py [--output results.jsonl] [--radii 1,5,15]
+       [--points 1,10,50] [--tables 1,4] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MILES = 1609.34
+CENTER_LNG, CENTER_LAT = -71.06, 42.36
+CELL_KM = 1.0
+GRID_CELLS = 70  # 70 km x 70 km covers a 15 mile radius around every point
+VARIABLES_PER_TABLE = 50
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves group(...) data and groups/<table>.json metadata like the Census API.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if "/groups/" in url.path:
+            table = url.path.rsplit("/", 1)[1][:-len(".json")]
+            variables = {"GEO_ID": {"label": "Geography"}, "NAME": {"label": "Geographic Area Name"}}
+            for v in range(1, VARIABLES_PER_TABLE + 1):
+                variables[f"{table}_{v:03d}E"] = {"label": f"Estimate!!Total:!!Variable {v}", "concept": table}
+                variables[f"{table}_{v:03d}M"] = {"label": f"Margin of Error!!Total:!!Variable {v}", "concept": table}
+            return self._send({"variables": variables})
+
+        query = parse_qs(url.query)
+        table = query["get"][0][len("group("):-1]
+        ucgids = query["ucgid"][0].split(",")
+        headers = ["GEO_ID", "NAME"]
+        for v in range(1, VARIABLES_PER_TABLE + 1):
+            headers += [f"{table}_{v:03d}E", f"{table}_{v:03d}M"]
+        rows = [headers + ["ucgid"]]
+        for ucgid in ucgids:
+            rng = random.Random(f"{table}{ucgid}")
+            values = []
+            for _ in range(VARIABLES_PER_TABLE):
+                values += [str(rng.randint(0, 2000)), str(rng.randint(0, 200))]
+            rows.append([ucgid, f"Block Group {ucgid[-4:]}"] + values + [ucgid])
+        self._send(rows)
+
+
+def start_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_block_groups():
+    """
+    A jittered grid of densified square block groups around the center point.
+    """
+    import shapely
+    from shapely.geometry import Polygon, mapping
+
+    rng = random.Random(0)
+    dlat = CELL_KM / 111.0
+    dlng = CELL_KM / (111.0 * 0.74)
+    origin_lng = CENTER_LNG - GRID_CELLS / 2 * dlng
+    origin_lat = CENTER_LAT - GRID_CELLS / 2 * dlat
+    for i in range(GRID_CELLS):
+        for j in range(GRID_CELLS):
+            x, y = origin_lng + i * dlng, origin_lat + j * dlat
+            polygon = Polygon([(x, y), (x + dlng, y), (x + dlng, y + dlat), (x, y + dlat)])
+            # TIGER block groups have many vertices; approximate that
+            polygon = shapely.segmentize(polygon, dlng / 25)
+            yield {
+                "geometry": mapping(polygon),
+                "properties": {"GEOIDFQ": f"1500000US25{i:04d}{j:04d}{rng.randint(0, 9)}"},
+            }
+
+
+def sample_points(count, radius_meters):
+    rng = random.Random(count)
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [CENTER_LNG + rng.uniform(-0.05, 0.05), CENTER_LAT + rng.uniform(-0.05, 0.05)]},
+            "properties": {"name": f"Site {i + 1}", "radius": radius_meters},
+        }
+        for i in range(count)
+    ]
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(stages, name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+    return result
+
+
+def fresh_census_cache(cache_dir):
+    from census_dashboard import census_cache
+
+    # a fresh Census cache for every pass, so the first fetch is cold
+    census_cache._cache = census_cache.CensusCache(os.path.join(cache_dir, f"{time.monotonic_ns()}.sqlite3"))
+
+
+def search(features, table_codes, stages):
+    """
+    Runs the search_census stages, adding each one's time to stages.
+    """
+    import pandas as pd
+    from census_dashboard import census_lib as cl, pipeline
+
+    block_group_gdfs = [
+        timed(stages, "find_block_groups", pipeline.find_block_groups, *feature["geometry"]["coordinates"], feature["properties"]["radius"])
+        for feature in features
+    ]
+    all_ucgids = pd.concat([gdf["GEOIDFQ"] for gdf in block_group_gdfs])
+    timed(stages, "fetch_cold", cl.fetch_census_tables, table_codes, all_ucgids)
+    tables_data = timed(stages, "fetch_warm", cl.fetch_census_tables, table_codes, all_ucgids)
+
+    point_names = [feature["properties"]["name"] for feature in features]
+    frames = []
+    for table_code in table_codes:
+        data_df = timed(stages, "aggregate", pipeline.table_estimates, table_code, block_group_gdfs, tables_data[table_code])
+        data_df["point_name"] = [point_names[i] for i in data_df["point"]]
+        frames.append(data_df)
+    timed(stages, "pivot", pipeline.pivot_estimates, frames)
+    geo_json = timed(stages, "highlight", pipeline.highlight_geo_json, block_group_gdfs)
+    payload = timed(stages, "serialize", json.dumps, geo_json)
+    return block_group_gdfs, all_ucgids, payload
+
+
+def run_case(features, table_codes, cache_dir):
+    # Stages are timed with tracing off, since tracemalloc slows allocation
+    # heavy code several times over; peak memory comes from a second pass
+    fresh_census_cache(cache_dir)
+    stages = {}
+    block_group_gdfs, all_ucgids, payload = search(features, table_codes, stages)
+    # The pipeline fetches once: total is a run on a cold Census cache, total_warm on a warm one
+    shared = sum(seconds for name, seconds in stages.items() if not name.startswith("fetch_"))
+    stages["total"] = shared + stages["fetch_cold"]
+    stages["total_warm"] = shared + stages["fetch_warm"]
+
+    fresh_census_cache(cache_dir)
+    tracemalloc.start()
+    try:
+        search(features, table_codes, {})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+        "peak_memory_mb": round(peak / 2**20, 2),
+        "block_groups": int(sum(len(gdf) for gdf in block_group_gdfs)),
+        "unique_block_groups": int(all_ucgids.nunique()),
+        "highlight_bytes": len(payload),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="append JSON lines here (default: stdout)")
+    parser.add_argument("--radii", default="1,5,15", help="radii in miles")
+    parser.add_argument("--points", default="1,10,50")
+    parser.add_argument("--tables", default="1,4")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    server = start_stand_in()
+    workdir = tempfile.mkdtemp(prefix="census-bench-")
+    os.environ.update({
+        "CENSUS_API_URL": f"http://127.0.0.1:{server.server_port}/data",
+        "SPATIAL_ENGINE": "local",
+        "SPATIAL_INDEX_DIR": workdir,
+        "VARIABLE_CATALOG_DIR": workdir,
+    })
+    os.environ.setdefault("CENSUS_API_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    from census_dashboard import spatial_index
+
+    spatial_index.build_index(synthetic_block_groups(), os.path.join(workdir, "block-group-geojson"))
+
+    commit = current_commit()
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for radius in [float(r) for r in args.radii.split(",")]:
+            for point_count in [int(p) for p in args.points.split(",")]:
+                for table_count in [int(t) for t in args.tables.split(",")]:
+                    features = sample_points(point_count, radius * MILES)
+                    table_codes = [f"B{90001 + t}" for t in range(table_count)]
+                    for run in range(args.repeat):
+                        result = run_case(features, table_codes, workdir)
+                        record = {
+                            "benchmark": "search_census",
+                            "commit": commit,
+                            "radius_miles": radius,
+                            "points": point_count,
+                            "tables": table_count,
+                            "run": run,
+                            **result,
+                        }
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+    finally:
+        if args.output:
+            out.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Startup budget check: how long a fresh worker takes to import census_dashboard
+and build the Dash app, and which heavy modules that pulls in.
+
+Each run is a new interpreter, like a freshly forked worker. The check fails
+(exit status 1) when the best of the runs exceeds the budget, or when a module
+that should only load on first use (the data pipeline, Mongo, OpenAI) is
+imported at startup. It also fails when a module that scripts import on
+their own (the ingest scripts, geometry) cannot be imported first in a fresh
+interpreter, which is how a circular import between lazily loaded modules
+shows up.
+
+Usage: python benchmarks/import_time.py [--budget 1.5] [--runs 5]
+The budget in seconds defaults to IMPORT_TIME_BUDGET (1.5).
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded until a callback needs them
+LAZY_MODULES = ['pandas', 'geopandas', 'shapely', 'pyproj', 'scipy', 'pymongo', 'openai', 'census_dashboard.pipeline']
+
+# Entry points imported on their own by scripts and worker processes
+STANDALONE_MODULES = [
+    'shp_to_db',
+    'census_dashboard.geometry',
+    'census_dashboard.spatial_index',
+    'census_dashboard.pipeline',
+    'census_dashboard.warehouse',
+]
+
+STARTUP = """
+import sys, json, time
+start = time.perf_counter()
+from flask import Flask
+import census_dashboard
+census_dashboard.create_dash_app(Flask(__name__))
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(runs):
+    env = dict(os.environ, BACKGROUND_CACHE_DIR=tempfile.mkdtemp(prefix="census-startup-"))
+    results = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", STARTUP % LAZY_MODULES], cwd=ROOT, env=env, text=True)
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def check_standalone_imports():
+    """
+    Imports each of STANDALONE_MODULES first thing in a fresh interpreter.
+
+    :return: {module: error output} for the modules that failed
+    """
+    failures = {}
+    for module in STANDALONE_MODULES:
+        result = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            stderr = result.stderr.strip()
+            failures[module] = stderr.splitlines()[-1] if stderr else f"exit status {result.returncode}"
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET", "1.5")))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    import_failures = check_standalone_imports()
+    results = measure(args.runs)
+    best = min(r["seconds"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    print(json.dumps({"best_seconds": round(best, 3), "budget_seconds": args.budget, "eager_modules": loaded,
+                      "import_failures": import_failures}))
+
+    failed = False
+    for module, error in import_failures.items():
+        print(f"Importing {module} on its own fails: {error}", file=sys.stderr)
+        failed = True
+    if best > args.budget:
+        print(f"Startup took {best:.2f}s, over the {args.budget:.2f}s budget", file=sys.stderr)
+        failed = True
+    if loaded:
+        print(f"Imported at startup but should be lazy: {', '.join(loaded)}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,14 @@
-from .app import create_dash_app
-from .callbacks import register_callbacks
-from .layout import create_layout
\ No newline at end of file
+# The Dash app is imported on first access, so scripts that only need a
+# submodule (e.g. shp_to_db using census_dashboard.display) do not load Dash.
+_EXPORTS = {
+    'create_dash_app': 'app',
+    'register_callbacks': 'callbacks',
+    'create_layout': 'layout',
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
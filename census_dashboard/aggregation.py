@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Columns of a group() response that identify the geography rather than hold values
+GEO_COLUMNS = ['GEO_ID', 'NAME', 'ucgid']
+
+
+def overlap_matrix(block_group_gdfs):
+    """
+    Builds the sparse (points x block groups) matrix of overlap weights.
+
+    Parameters:
+    - block_group_gdfs (list): One GeoDataFrame per point, with a GEOIDFQ and
+      optional percent_overlap column (weights default to 1).
+
+    Returns:
+    - sparse.csr_matrix: weights[i, j] is the share of block group j inside point i.
+    - pd.Index: The GEOIDFQ of each matrix column.
+    """
+    lengths = [len(gdf) for gdf in block_group_gdfs]
+    if not any(lengths):
+        return sparse.csr_matrix((len(block_group_gdfs), 0)), pd.Index([], name='GEOIDFQ')
+
+    geoids = np.concatenate([gdf['GEOIDFQ'].to_numpy() for gdf in block_group_gdfs])
+    weights = np.concatenate([
+        gdf['percent_overlap'].to_numpy(dtype=np.float64) if 'percent_overlap' in gdf.columns else np.ones(len(gdf))
+        for gdf in block_group_gdfs
+    ])
+    cols, ucgids = pd.factorize(geoids)
+    rows = np.repeat(np.arange(len(block_group_gdfs)), lengths)
+    matrix = sparse.csr_matrix((weights, (rows, cols)), shape=(len(block_group_gdfs), len(ucgids)))
+    return matrix, pd.Index(ucgids, name='GEOIDFQ')
+
+
+def value_matrix(bg_data, ucgids):
+    """
+    Builds the dense (block groups x variables) float matrix of a table.
+
+    Parameters:
+    - bg_data (pd.DataFrame): Rows of the table indexed by GEOIDFQ.
+    - ucgids (pd.Index): Block groups in matrix row order.
+
+    Returns:
+    - np.ndarray: Values, NaN where a block group or value is missing or not numeric.
+    - pd.Index: The variable of each matrix column.
+    """
+    frame = bg_data.drop(columns=GEO_COLUMNS, errors='ignore').reindex(ucgids)
+    values = np.empty(frame.shape, dtype=np.float64)
+    # columns already numeric (e.g. from the warehouse) are used as they are
+    numeric = np.array([pd.api.types.is_numeric_dtype(dtype) for dtype in frame.dtypes], dtype=bool)
+    if numeric.any():
+        values[:, numeric] = frame.loc[:, numeric].to_numpy(dtype=np.float64, na_value=np.nan)
+    if not numeric.all():
+        # parse the remaining columns in one pass rather than column by column
+        text = frame.loc[:, ~numeric]
+        flat = pd.to_numeric(pd.Series(text.to_numpy().ravel()), errors='coerce')
+        values[:, ~numeric] = flat.to_numpy(dtype=np.float64, na_value=np.nan).reshape(text.shape)
+    return values, frame.columns
+
+
+def weighted_sum(weights, values):
+    """
+    Computes every point's estimates with a single sparse-dense matrix product.
+
+    Missing values count as zero, except that a variable with no value in any of
+    a point's block groups is NaN for that point.
+
+    Returns:
+    - np.ndarray: (points x variables) estimates.
+    """
+    valid = ~np.isnan(values)
+    estimates = np.asarray(weights @ np.where(valid, values, 0.0))
+    covered = np.asarray((weights != 0).astype(np.float64) @ valid.astype(np.float64))
+    estimates[covered == 0] = np.nan
+    return estimates
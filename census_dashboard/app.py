@@ -1,22 +1,47 @@
 # dash_app/app.py
 
+import os
+
 import dash
 import dash_bootstrap_components as dbc
+from dotenv import load_dotenv
 from flask import Flask
 
 import census_dashboard as cd
+from census_dashboard import metrics, site_analysis
+
+def create_background_callback_manager():
+    """
+    Disk-backed job manager running background callbacks on a pool of
+    BACKGROUND_WORKERS (default 2) long-lived worker processes, so long
+    "Get Data" jobs do not tie up the web workers and start warm.
+    """
+    import diskcache
+    from census_dashboard.background import PooledDiskcacheManager
+    cache = diskcache.Cache(os.getenv("BACKGROUND_CACHE_DIR", "data/background-cache"))
+    return PooledDiskcacheManager(cache, processes=int(os.getenv("BACKGROUND_WORKERS", "2")))
 
 def create_dash_app(server: Flask, url_base_pathname: str = "/"):
     """
     Factory function to create a Dash application.
     """
+    # Settings are read when first needed, so load them before anything runs
+    load_dotenv()
+
     app = dash.Dash(
         __name__,
         server=server,
         url_base_pathname=url_base_pathname,
         external_stylesheets=[dbc.themes.SPACELAB],
+        background_callback_manager=create_background_callback_manager(),
     )
 
+    # Server-Timing headers, /metrics and PROFILE_DIR profiles
+    metrics.init_app(server)
+
+    # Batch REST endpoint: POST /api/site-analysis
+    site_analysis.init_app(server)
+
     # Set the layout
     app.layout = cd.create_layout()
 
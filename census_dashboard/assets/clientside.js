@@ -0,0 +1,64 @@
+// Clientside callbacks, registered from Python with ClientsideFunction("census", "<name>").
+// They only redraw the map and echo inputs, so they never need a round trip to the server.
+(function() {
+    var MILES = 1609.34;
+
+    function leaflet(type, props) {
+        return {type: type, namespace: "dash_leaflet", props: props};
+    }
+
+    function triggeredId() {
+        var triggered = window.dash_clientside.callback_context.triggered;
+        if (!triggered || !triggered.length || !triggered[0].prop_id) {
+            return null;
+        }
+        return triggered[0].prop_id.split(".")[0];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        census: {
+            // Red outline of the search circle around the last map click
+            displayCoordinatesAndState: function(clickData, radius, unit) {
+                if (!clickData || radius === null || radius === undefined) {
+                    return ["Click on the map to get coordinates.", []];
+                }
+                var lat = Number(clickData.latlng.lat);
+                var lng = Number(clickData.latlng.lng);
+                var radiusMeters = unit === "miles" ? radius * MILES : radius * 1000;
+                var circle = leaflet("Circle", {
+                    center: [lat, lng], radius: radiusMeters, color: "red", fill: true, fillOpacity: 0
+                });
+                return ["Latitude: " + lat.toFixed(6) + ", Longitude: " + lng.toFixed(6), [circle]];
+            },
+
+            // Random id of the browser tab, which its results are stored under on the server
+            ensureSessionId: function(_, sessionId) {
+                if (sessionId) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                if (window.crypto && window.crypto.randomUUID) {
+                    return window.crypto.randomUUID();
+                }
+                // randomUUID needs a secure context; plain http falls back to Math.random
+                return Date.now().toString(36) + Math.random().toString(36).slice(2) + Math.random().toString(36).slice(2);
+            },
+
+            // Keeps the radius slider and number input in step, and rescales them with the unit
+            syncRadiusInputs: function(sliderValue, inputValue, unit) {
+                var triggered = triggeredId();
+                var maxValue = unit === "miles" ? 15 : 25;
+                var marks = {};
+                for (var i = 1; i <= maxValue; i += 2) {
+                    marks[i] = String(i);
+                }
+                if (triggered === "radius-slider" || triggered === "unit-toggle") {
+                    return [sliderValue, sliderValue, maxValue, marks];
+                }
+                if (triggered === "radius-input") {
+                    return [inputValue, inputValue, maxValue, marks];
+                }
+                throw window.dash_clientside.PreventUpdate;
+            }
+        }
+    });
+})();
@@ -0,0 +1,9 @@
+// Style functions referenced from Python as {"variable": "dashExtensions.census.<name>"}
+window.dashExtensions = Object.assign({}, window.dashExtensions, {
+    census: {
+        // Block groups are shaded by how much of them lies inside the circle
+        highlightStyle: function(feature) {
+            return {color: "blue", weight: 1, fillOpacity: feature.properties.percent_overlap * 0.5};
+        }
+    }
+});
@@ -0,0 +1,123 @@
+import os
+import logging
+import threading
+
+import dash
+
+logger = logging.getLogger(__name__)
+
+# The manager whose callbacks the pool workers run
+_manager = None
+
+
+def _job_key(job):
+    return f"pooled-job-{job}"
+
+
+def warm():
+    """
+    Loads what every Get Data job needs once per worker process: the pipeline
+    modules, the spatial index, the variable catalog and the HTTP and Mongo
+    clients. Failures are only logged; the job that needs it will raise.
+    """
+    try:
+        import census_dashboard.pipeline  # noqa: F401 (geopandas, shapely, scipy)
+        from census_dashboard import db, http_client, spatial_index
+        from census_dashboard.census_lib import ACS_YEAR
+        from census_dashboard.variable_catalog import get_catalog
+
+        http_client.get_session()
+        get_catalog(ACS_YEAR)
+        if os.getenv('SPATIAL_ENGINE', 'mongo') == 'local':
+            spatial_index.get_index('block-group-geojson')
+        elif os.getenv('MONGODB_URI'):
+            db.get_client()
+    except Exception:
+        logger.exception("Could not warm up background worker %d", os.getpid())
+
+
+def _run_job(background_key, job, result_key, progress_key, args, context):
+    cache = _manager.handle
+    with cache.transact():
+        if cache.get(_job_key(job)) is None:
+            return  # cancelled while queued
+        cache.set(_job_key(job), os.getpid())
+    try:
+        _manager.func_registry[background_key](result_key, progress_key, args, context)
+    finally:
+        # Only after job_fn has stored the result, so a poll always sees the job running or its result
+        cache.delete(_job_key(job))
+
+
+class PooledDiskcacheManager(dash.DiskcacheManager):
+    """
+    DiskcacheManager that runs jobs on a pool of long-lived worker processes
+    instead of forking a new process for every job.
+
+    Workers are forked once (after the callbacks are registered) and warmed up
+    with warm(), so the Mongo and HTTP connection pools, the spatial index and
+    the geometry caches are reused from one Get Data click to the next.
+    Cancelling a running job kills its worker, which the pool replaces.
+
+    Parameters:
+    - cache (diskcache.Cache): Where results, progress and job states are kept.
+    - processes (int): Number of worker processes.
+    """
+
+    def __init__(self, cache, processes=2, **kwargs):
+        super().__init__(cache, **kwargs)
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        global _manager
+        with self._lock:
+            if self._pool is None:
+                from multiprocess import get_context
+                # forked workers inherit the callback registry and this manager
+                _manager = self
+                self._pool = get_context('fork').Pool(self.processes, initializer=warm)
+            return self._pool
+
+    def call_job_fn(self, key, job_fn, args, context):
+        import uuid
+        background_key = next(k for k, f in self.func_registry.items() if f is job_fn)
+        job = uuid.uuid4().hex
+        self.handle.set(_job_key(job), 'queued')
+        self._get_pool().apply_async(
+            _run_job, (background_key, job, key, self._make_progress_key(key), args, context)
+        )
+        return job
+
+    def get_result(self, key, job):
+        # DiskcacheManager.get_result terminates the job once its result is in,
+        # which here would kill a worker that may already be running the next one
+        result = super().get_result(key, None)
+        if result is not self.UNDEFINED and job is not None:
+            self.handle.delete(_job_key(job))
+        return result
+
+    def job_running(self, job):
+        return job is not None and self.handle.get(_job_key(job)) is not None
+
+    def terminate_job(self, job):
+        if job is None:
+            return
+        import psutil
+        with self.handle.transact():
+            state = self.handle.pop(_job_key(job))
+            # A queued job is skipped once its state is gone; a running one is killed
+            if isinstance(state, int) and psutil.pid_exists(state):
+                try:
+                    psutil.Process(state).kill()
+                except psutil.NoSuchProcess:
+                    pass
+
+    def terminate_unhealthy_job(self, job):
+        import psutil
+        state = self.handle.get(_job_key(job))
+        if isinstance(state, int) and not psutil.pid_exists(state):
+            self.handle.delete(_job_key(job))
+            return True
+        return False
@@ -1,24 +1,126 @@
 # dash_app/callbacks.py
 
+import os
 import json
 import base64
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point, shape
-from dash.dependencies import Input, Output, State, ALL
-from dash import dash_table, dcc, html, callback_context
+import uuid
+from dash.dependencies import Input, Output, State, ALL, ClientsideFunction
+from dash import dash_table, dcc, html, callback_context, Patch
 from dash.exceptions import PreventUpdate
 import dash
 import dash_leaflet as dl
 import dash_bootstrap_components as dbc
 
-# Import any custom utilities
-import census_dashboard.util as util
-import census_dashboard.census_lib as cl
+# pandas and the data pipeline (geopandas, shapely, pymongo, openai) are
+# imported inside the callbacks that use them, so the app starts without them
+import census_dashboard.metrics as metrics
 
 # If you moved these from layout.py constants:
 DEFAULT_RADIUS = 5 * 1609.34
 
+# Client-side style function defined in assets/highlight.js
+HIGHLIGHT_STYLE = {"variable": "dashExtensions.census.highlightStyle"}
+
+
+def format_values(pivot_df):
+    """
+    Formats the numeric estimates of a pivot as rounded, comma-separated strings.
+    """
+    import pandas as pd
+    values = pivot_df.drop(columns='point_name')
+    formatted = values.apply(lambda col: col.map(lambda x: f"{round(x):,}" if pd.notna(x) else ""))
+    return pd.concat([pivot_df[['point_name']], formatted], axis=1)
+
+
+def make_data_table(pivot_df):
+    """
+    Builds the results DataTable from a pivot of estimates.
+    """
+    pivot_df = format_values(pivot_df)
+    columns = [{"name": str(col), "id": str(col)} for col in pivot_df.columns]
+    return dash_table.DataTable(
+        columns=columns,
+        data=pivot_df.to_dict('records'),
+        style_table={'overflowX': 'auto'},
+        style_cell={'textAlign': 'left'},
+        style_header={'backgroundColor': 'rgb(30, 30, 30)', 'color': 'white'},
+        style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'},
+    )
+
+
+def make_highlight_layer(geo_json):
+    """
+    Builds the single GeoJSON layer showing the block groups of a search.
+
+    With HIGHLIGHT_FORMAT=geobuf the FeatureCollection is sent geobuf-encoded,
+    which needs the optional geobuf package.
+    """
+    if os.getenv("HIGHLIGHT_FORMAT", "geojson") == "geobuf":
+        import dash_leaflet.express as dlx
+        return dl.GeoJSON(data=dlx.geojson_to_geobuf(geo_json), format="geobuf", style=HIGHLIGHT_STYLE)
+    return dl.GeoJSON(data=geo_json, style=HIGHLIGHT_STYLE)
+
+
+def make_point_row(feature):
+    """
+    Builds the points-list row of a feature, keyed by its uid so rows keep their
+    identity as others are added and removed.
+    """
+    uid = feature['properties']['uid']
+    buttons = [
+        dbc.Button(
+            "Remove",
+            id={'type': 'remove-point-button', 'index': uid},
+            color="danger",
+            size="sm"
+        )
+    ]
+    if feature['geometry']['type'] == 'Point':
+        # Saving applies the current radius, so only points have it
+        buttons.insert(0, dbc.Button(
+            "Save",
+            id={'type': 'save-point-button', 'index': uid},
+            color="primary",
+            size="sm",
+        ))
+    return dbc.InputGroup(
+        [
+            dbc.Input(
+                id={'type': 'point-name-input', 'index': uid},
+                type='text',
+                value=feature['properties']['name'],
+            ),
+            *buttons
+        ],
+        className='list-group-item d-flex align-items-center'
+    )
+
+
+def make_point_layer(feature):
+    """
+    Builds the map layer of a feature: a green circle and a named marker for a
+    point, nothing for other geometries. There is one layer per feature, so the
+    layers line up with the features of geo-json-store.
+    """
+    children = []
+    if feature['geometry']['type'] == 'Point':
+        lng, lat = feature['geometry']['coordinates']
+        children = [
+            dl.Circle(
+                center=(lat, lng),
+                radius=feature['properties']['radius'],
+                color='green',
+                fill=True,
+                fillOpacity=0.1
+            ),
+            dl.Marker(
+                position=[lat, lng],
+                children=[dl.Tooltip(content=feature['properties']['name'])]
+            ),
+        ]
+    return dl.LayerGroup(id={'type': 'point-layer', 'index': feature['properties']['uid']}, children=children)
+
+
 def register_callbacks(app):
 
     @app.callback(
@@ -40,9 +142,11 @@ def register_callbacks(app):
     )
     def search_table(n_clicks, query):
         if n_clicks > 0 and query:
+            import pandas as pd
+            import census_dashboard.util as util
             results = util.semantic_search_2023_tables(query)
             results = pd.DataFrame(results)
-            results.drop(columns=['_id'], inplace=True)
+            results.drop(columns=['_id'], inplace=True, errors='ignore')
             return results.to_dict('records'), []
         return [], []
 
@@ -76,29 +180,15 @@ def register_callbacks(app):
 
         return ','.join(updated_table_codes)
 
-    @app.callback(
+    # Map-only interactions run in the browser (assets/clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="census", function_name="displayCoordinatesAndState"),
         [Output("click-output", "children"),
          Output("circle-layer", "children")],
         [Input("map", "clickData"),
          Input("radius-input", "value"),
          Input("unit-toggle", "value")],
     )
-    def display_coordinates_and_state(clickData, radius, unit):
-        click_output = "Click on the map to get coordinates."
-        circle_layer = []
-        if clickData and radius is not None:
-            lat, lng = float(clickData['latlng']['lat']), float(clickData['latlng']['lng'])
-            radius_meters = radius * 1609.34 if unit == 'miles' else radius * 1000
-            dl_circle = dl.Circle(
-                center=(lat, lng),
-                radius=radius_meters,
-                color='red',
-                fill=True,
-                fillOpacity=0
-            )
-            circle_layer = [dl_circle]
-            click_output = f"Latitude: {lat:.6f}, Longitude: {lng:.6f}"
-        return click_output, circle_layer
 
     def make_geojson_circle(lat, lng, radius_meters):
         geo_json = {
@@ -113,9 +203,15 @@ def register_callbacks(app):
         }
         return geo_json
 
-    # Combined callback to handle adding, saving, removing points
+    # Combined callback to handle adding, saving, removing points.
+    # Only the changed features, rows and layers are sent, as Patches of the
+    # store, the points list and the layer group, which stay in the same order.
     @app.callback(
-        Output("geo-json-store", "data"),
+        [
+            Output("geo-json-store", "data"),
+            Output("points-list", "children"),
+            Output("prev-circle-layer", "children"),
+        ],
         [
             Input('add-point-button', 'n_clicks'),
             Input('geojson-upload', 'contents'),
@@ -123,7 +219,6 @@ def register_callbacks(app):
             Input({'type': 'remove-point-button', 'index': ALL}, 'n_clicks')
         ],
         [
-            State('geo-json-store', 'data'),
             State('poi-name-input', 'value'),
             State('map', 'clickData'),
             State('radius-slider', 'value'),
@@ -134,22 +229,28 @@ def register_callbacks(app):
         prevent_initial_call=True
     )
     def handle_points(add_clicks, contents, save_clicks, remove_point_clicks,
-                      geo_json, point_name, clickData, radius, unit, names, remove_ids):
+                      point_name, clickData, radius, unit, names, remove_ids):
         ctx = callback_context
         if not ctx.triggered:
-            return geo_json
+            raise PreventUpdate
 
         triggered = ctx.triggered[0]
         triggered_id = triggered['prop_id'].split('.')[0]
+        geo_json, points_list, layers = Patch(), Patch(), Patch()
 
         if triggered_id == 'add-point-button':
-            if clickData:
-                lat = float(clickData['latlng']['lat'])
-                lng = float(clickData['latlng']['lng'])
-                radius_meters = radius * 1609.34 if unit == 'miles' else radius * 1000
-                new_feature = make_geojson_circle(lat, lng, radius_meters)
-                new_feature["properties"]["name"] = point_name.strip() if point_name else f"Point {len(geo_json['features']) + 1}"
-                geo_json['features'].append(new_feature)
+            if not clickData:
+                raise PreventUpdate
+            lat = float(clickData['latlng']['lat'])
+            lng = float(clickData['latlng']['lng'])
+            radius_meters = radius * 1609.34 if unit == 'miles' else radius * 1000
+            new_feature = make_geojson_circle(lat, lng, radius_meters)
+            new_feature["properties"]["name"] = point_name.strip() if point_name else f"Point {len(remove_ids) + 1}"
+            new_feature["properties"]["uid"] = uuid.uuid4().hex
+            geo_json['features'].append(new_feature)
+            points_list.append(make_point_row(new_feature))
+            layers.append(make_point_layer(new_feature))
+            return geo_json, points_list, layers
 
         elif triggered_id == 'geojson-upload':
             if contents is None:
@@ -177,58 +278,37 @@ def register_callbacks(app):
                         feature["properties"] = {}
                     if "name" not in feature["properties"]:
                         feature["properties"]["name"] = f"Uploaded Feature {i + 1}"
+                feature["properties"]["uid"] = uuid.uuid4().hex
 
-            geo_json['features'] += new_geo_json['features']
-            return geo_json
-
-        else:
-            # If a dynamic button was triggered
-            button_id_dict = json.loads(triggered_id)
-            if button_id_dict['type'] == 'save-point-button':
-                index = button_id_dict['index']
-                if names[index]:
-                    radius_meters = radius * 1609.34 if unit == 'miles' else radius * 1000
-                    lat = geo_json["features"][index]["geometry"]["coordinates"][1]
-                    lng = geo_json["features"][index]["geometry"]["coordinates"][0]
-                    updated_feature = make_geojson_circle(lat, lng, radius_meters)
-                    updated_feature["properties"]["name"] = names[index].strip()
-                    updated_feature["properties"]["radius"] = radius_meters
-                    geo_json['features'][index] = updated_feature
-
-            elif button_id_dict['type'] == 'remove-point-button':
-                index = button_id_dict['index']
-                if 0 <= index < len(geo_json['features']):
-                    geo_json['features'].pop(index)
+            geo_json['features'].extend(new_geo_json['features'])
+            points_list.extend([make_point_row(feature) for feature in new_geo_json['features']])
+            layers.extend([make_point_layer(feature) for feature in new_geo_json['features']])
+            return geo_json, points_list, layers
 
-        return geo_json
+        # A dynamic button was triggered; ignore rows that were just rendered
+        if not triggered['value']:
+            raise PreventUpdate
+        button_id_dict = json.loads(triggered_id)
+        position = [button_id['index'] for button_id in remove_ids].index(button_id_dict['index'])
 
-    @app.callback(
-        Output("prev-circle-layer", "children"),
-        [Input("geo-json-store", "data")],
-    )
-    def update_circles_layer(geo_json):
-        circle_layer = []
-        for feature in geo_json['features']:
-            if feature['geometry']['type'] == 'Point':
-                lng, lat = feature['geometry']['coordinates']
-                radius = feature['properties']['radius']
-                name = feature['properties']['name']
-                circle_layer.append(
-                    dl.Circle(
-                        center=(lat, lng),
-                        radius=radius,
-                        color='green', 
-                        fill=True, 
-                        fillOpacity=0.1
-                    )
-                )
-                circle_layer.append(
-                    dl.Marker(
-                        position=[lat, lng],
-                        children=[dl.Tooltip(content=name)]
-                    )
-                )
-        return circle_layer
+        if button_id_dict['type'] == 'save-point-button':
+            if not names[position]:
+                raise PreventUpdate
+            radius_meters = radius * 1609.34 if unit == 'miles' else radius * 1000
+            name = names[position].strip()
+            geo_json['features'][position]['properties']['name'] = name
+            geo_json['features'][position]['properties']['radius'] = radius_meters
+            # The row already shows the new name; patch the circle and tooltip of the point's layer
+            point_layer = layers[position]['props']['children']
+            point_layer[0]['props']['radius'] = radius_meters
+            point_layer[1]['props']['children'][0]['props']['content'] = name
+            return geo_json, dash.no_update, layers
+
+        # remove-point-button
+        del geo_json['features'][position]
+        del points_list[position]
+        del layers[position]
+        return geo_json, points_list, layers
 
     @app.callback(
         [
@@ -239,11 +319,37 @@ def register_callbacks(app):
         [Input("get-data-button", "n_clicks")],
         [
             State("geo-json-store", "data"),
-            State("table-input", "value")
+            State("table-input", "value"),
+            State("session-id", "data")
+        ],
+        background=True,
+        progress=[
+            Output("data-progress", "value"),
+            Output("data-progress", "max"),
+            Output("data-progress", "label"),
+            Output("partial-data-table", "children"),
+        ],
+        running=[
+            (Output("data-progress", "style"), {"display": "flex"}, {"display": "none"}),
+            (Output("cancel-data-button", "style"), {"display": "inline-block"}, {"display": "none"}),
+            (Output("partial-data-table", "style"), {"display": "block"}, {"display": "none"}),
         ],
+        # Clicking "Get Data" again also cancels the running job before starting a new one
+        cancel=[Input("cancel-data-button", "n_clicks")],
         prevent_initial_call=True
     )
-    def search_census(_, geo_json_data, table_codes_input):
+    def search_census(set_progress, _, geo_json_data, table_codes_input, session_id):
+        # Background jobs run in their own process, so publish its metrics when done
+        try:
+            with metrics.profile('search_census'), metrics.span('search_census'):
+                return run_search(set_progress, geo_json_data, table_codes_input, session_id)
+        finally:
+            metrics.flush()
+
+    def run_search(set_progress, geo_json_data, table_codes_input, session_id):
+        import census_dashboard.pipeline as pipeline
+        import census_dashboard.result_cache as result_cache
+
         if len(geo_json_data['features']) == 0:
             return html.Div("No Features defined."), [], None
 
@@ -251,89 +357,46 @@ def register_callbacks(app):
         if not table_codes:
             return html.Div("No valid table codes provided."), [], None
 
+        features = geo_json_data['features']
+        if any(feature['geometry']['type'] != 'Point' for feature in features):
+            return html.Div("Invalid GeoJSON data."), [], None
+
+        total_steps = len(features) + len(table_codes)
         final_list = []
         final_block_groups = []
 
-        for feature in geo_json_data['features']:
-            if feature['geometry']['type'] != 'Point':
-                return html.Div("Invalid GeoJSON data."), [], None
-
-            lng, lat = feature['geometry']['coordinates']
-            radius_meters = feature["properties"]['radius']
-            point = Point(lng, lat)
-
-            # Figure out correct UTM zone
-            utm_epsg = util.get_utm_epsg(lat, lng)
-
-            # Buffer in projected space
-            projected_point = gpd.GeoSeries([point], crs=4326).to_crs(epsg=utm_epsg).iloc[0]
-            circle = projected_point.buffer(radius_meters)
-
-            # Find intersecting block groups
-            query_circle = gpd.GeoSeries([point], crs=4326).to_crs(epsg=utm_epsg).buffer(radius_meters).to_crs(epsg=4326).iloc[0].__geo_interface__
-            db_results = util.find_intersecting_features('census-dashboard', 'block-group-geojson', query_circle)
-            db_results = [{'geometry': doc['geometry'], **doc['properties']} for doc in db_results]
-            db_results = pd.DataFrame(db_results)
-            db_results['geometry'] = db_results['geometry'].apply(shape)
-            block_group_gdf = gpd.GeoDataFrame(db_results, crs="EPSG:4326")
-
-            # Calculate distance, overlap, etc.
-            projected_gdf = block_group_gdf.to_crs(epsg=utm_epsg)
-            projected_gdf['distance'] = projected_gdf.centroid.distance(projected_point)
-
-            # Overlap
-            projected_circle = gpd.GeoSeries([circle], crs=utm_epsg).to_crs(epsg=4326).iloc[0]
-            block_group_gdf['percent_overlap'] = block_group_gdf.geometry.apply(
-                lambda geom: geom.intersection(projected_circle).area / geom.area if not geom.is_empty else 0
-            )
-            block_group_gdf = block_group_gdf[block_group_gdf['percent_overlap'] > 0]
-
-            for table_code in table_codes:
-                data_df = cl.aggregate_blockgroups(table_code, block_group_gdf)
-                data_df["Value"] = data_df["Value"].apply(lambda x: f"{round(x):,}" if pd.notna(x) else "")
-                data_df = data_df[data_df["VarID"].str.endswith("E")]
-                data_df['point_name'] = feature['properties']['name']
-                final_list.append(data_df)
-
-            final_block_groups.append(block_group_gdf)
+        # Points and (point, table) cells computed by earlier clicks come from the result cache
+        points = [(*feature['geometry']['coordinates'], feature["properties"]['radius']) for feature in features]
+        for i, (feature, (lng, lat, radius)) in enumerate(zip(features, points)):
+            set_progress((i, total_steps, f"Finding block groups for {feature['properties']['name']}", dash.no_update))
+            final_block_groups.append(pipeline.cached_block_groups(lng, lat, radius))
+
+        point_names = [feature['properties']['name'] for feature in features]
+        set_progress((len(features), total_steps, f"Fetching {len(table_codes)} tables", dash.no_update))
+        # All tables are fetched together; each is then aggregated and shown in turn
+        estimates = pipeline.iter_table_estimates(table_codes, points, final_block_groups)
+        for j, (_, data_df) in enumerate(estimates):
+            data_df['point_name'] = [point_names[i] for i in data_df['point']]
+            final_list.append(data_df)
+            # Show the tables finished so far while the rest are aggregated
+            set_progress((len(features) + j + 1, total_steps, f"Fetched {j + 1} of {len(table_codes)} tables", make_data_table(pipeline.pivot_estimates(final_list))))
 
         if not final_list:
             return html.Div("No data found for these points/tables."), [], None
 
-        big_df = pd.concat(final_list, ignore_index=True)
-
-        # Pivot
-        pivot_df = big_df.pivot_table(
-            index='point_name',
-            columns='Variable',
-            values='Value',
-            aggfunc='first'
-        ).reset_index()
-
-        # Build data table
-        columns = [{"name": str(col), "id": str(col)} for col in pivot_df.columns]
-        data_table = dash_table.DataTable(
-            columns=columns,
-            data=pivot_df.to_dict('records'),
-            style_table={'overflowX': 'auto'},
-            style_cell={'textAlign': 'left'},
-            style_header={'backgroundColor': 'rgb(30, 30, 30)', 'color': 'white'},
-            style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'},
-        )
+        pivot_df = pipeline.pivot_estimates(final_list)
+        with metrics.span('render'):
+            data_table = make_data_table(pivot_df)
 
-        final_block_group_gdf = pd.concat(final_block_groups, ignore_index=True)
-        final_geo_json = final_block_group_gdf.__geo_interface__
+        # One layer for all block groups, styled client-side from percent_overlap
+        geo_json = pipeline.highlight_geo_json(final_block_groups)
+        with metrics.span('render'):
+            highlight_layer = [make_highlight_layer(geo_json)]
 
-        # Create highlight layer
-        highlight_layer = [
-            dl.GeoJSON(
-                data=feature,
-                options=dict(style=dict(color="blue", weight=1, fillOpacity=overlap*0.5)),
-            )
-            for feature, overlap in zip(final_geo_json["features"], final_block_group_gdf['percent_overlap'])
-        ]
+        # The pivot stays on the server; the browser only gets a handle to it
+        result_handle = result_cache.put_result(session_id or uuid.uuid4().hex, pivot_df)
 
-        return data_table, highlight_layer, pivot_df.to_dict("records")
+        return data_table, highlight_layer, result_handle
 
     @app.callback(
         Output("download-dataframe-csv", "data"),
@@ -341,44 +404,23 @@ def register_callbacks(app):
         State("table-data-storage", "data"),
         prevent_initial_call=True
     )
-    def download_data(n_clicks, table_data):
-        if not table_data:
+    def download_data(n_clicks, result_handle):
+        import census_dashboard.result_cache as result_cache
+        pivot_df = result_cache.get_result(result_handle)
+        if pivot_df is None:
             return dash.no_update
-        df = pd.DataFrame(table_data)
+        df = format_values(pivot_df)
         return dcc.send_data_frame(df.to_csv, "census_data.csv", index=False)
 
-    @app.callback(
-        Output('points-list', 'children'),
-        [Input('geo-json-store', 'data')]
+    app.clientside_callback(
+        ClientsideFunction(namespace="census", function_name="ensureSessionId"),
+        Output("session-id", "data"),
+        Input("session-id", "modified_timestamp"),
+        State("session-id", "data"),
     )
-    def display_points(geo_json):
-        return [
-            dbc.InputGroup(
-                [
-                    dbc.Input(
-                        id={'type': 'point-name-input', 'index': i},
-                        type='text',
-                        value=feature['properties']['name'],
-                    ),
-                    dbc.Button(
-                        "Save",
-                        id={'type': 'save-point-button', 'index': i},
-                        color="primary",
-                        size="sm",
-                    ),
-                    dbc.Button(
-                        "Remove",
-                        id={'type': 'remove-point-button', 'index': i},
-                        color="danger",
-                        size="sm"
-                    )
-                ],
-                className='list-group-item d-flex align-items-center'
-            )
-            for i, feature in enumerate(geo_json['features'])
-        ]
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="census", function_name="syncRadiusInputs"),
         Output('radius-slider', 'value'),
         Output('radius-input', 'value'),
         Output('radius-slider', 'max'),
@@ -387,20 +429,3 @@ def register_callbacks(app):
         Input('radius-input', 'value'),
         Input('unit-toggle', 'value')
     )
-    def sync_radius_inputs(slider_value, input_value, unit):
-        ctx = callback_context
-        if not ctx.triggered:
-            raise PreventUpdate
-
-        max_value = 15 if unit == 'miles' else 25
-        marks = {i: f'{i}' for i in range(1, max_value + 1, 2)}
-
-        triggered_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        if triggered_id == 'radius-slider':
-            return slider_value, slider_value, max_value, marks
-        elif triggered_id == 'radius-input':
-            return input_value, input_value, max_value, marks
-        elif triggered_id == 'unit-toggle':
-            return slider_value, slider_value, max_value, marks
-
-        raise PreventUpdate
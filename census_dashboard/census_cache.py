@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Access times are refreshed at most this often (seconds), so most hits are read-only
+ACCESS_RESOLUTION = 3600
+# Entries are recounted after this many puts, to see rows added by other processes
+COUNT_INTERVAL = 100
+# Eviction trims the cache to this fraction of max_entries, so it does not run on every put
+LOW_WATER = 0.9
+
+
+class CensusCache:
+    """
+    Persistent cache of Census API rows, one entry per (vintage, group, ucgid).
+
+    ACS 5-year vintages never change once published, so a cached block group row
+    never goes stale. Entries are stored in a SQLite file and evicted least
+    recently used first once the cache holds more than `max_entries` rows.
+    Recency is tracked to the hour and the row count is estimated between
+    recounts, so hits and puts rarely pay for bookkeeping.
+
+    Parameters:
+    - path (str): Location of the SQLite file.
+    - max_entries (int): Maximum number of rows kept before LRU eviction.
+    - offline (bool): If True, callers must not go to the network on a miss.
+    """
+
+    def __init__(self, path, max_entries=500_000, offline=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # Upper estimate of the number of entries (None until counted)
+        self._entries = None
+        self._puts = 0
+
+    def _connect(self):
+        # sqlite connections must not cross a fork, so reconnect in child processes
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " vintage INTEGER, grp TEXT, ucgid TEXT, data TEXT, accessed REAL,"
+                " PRIMARY KEY (vintage, grp, ucgid))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS rows_accessed ON rows (accessed)")
+            self._pid = os.getpid()
+            self._entries = None
+        return self._conn
+
+    def get_many(self, vintage, group_name, ucgids):
+        """
+        Look up cached rows.
+
+        Returns:
+        - dict: Maps each cached ucgid to its row (a dict of column -> value).
+        """
+        ucgids = list(dict.fromkeys(ucgids))
+        found = {}
+        stale = []
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(ucgids), 500):
+                chunk = ucgids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT ucgid, data, accessed FROM rows WHERE vintage = ? AND grp = ? AND ucgid IN ({placeholders})",
+                    [vintage, group_name, *chunk],
+                )
+                for ucgid, data, accessed in cursor:
+                    found[ucgid] = json.loads(data)
+                    if accessed < now - ACCESS_RESOLUTION:
+                        stale.append(ucgid)
+            if stale:
+                conn.executemany(
+                    "UPDATE rows SET accessed = ? WHERE vintage = ? AND grp = ? AND ucgid = ?",
+                    [(now, vintage, group_name, ucgid) for ucgid in stale],
+                )
+                conn.commit()
+            self.hits += len(found)
+            self.misses += len(ucgids) - len(found)
+        return found
+
+    def put_many(self, vintage, group_name, rows):
+        """
+        Store rows in the cache.
+
+        Parameters:
+        - rows (dict): Maps each ucgid to its row (a dict of column -> value).
+        """
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO rows (vintage, grp, ucgid, data, accessed) VALUES (?, ?, ?, ?, ?)",
+                [(vintage, group_name, ucgid, json.dumps(row), now) for ucgid, row in rows.items()],
+            )
+            self._puts += 1
+            if self._entries is not None:
+                # replaced rows are counted too, which only makes the estimate high
+                self._entries += len(rows)
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        # Count only when the estimate may be over the limit or is getting old
+        if self._entries is not None and self._entries <= self.max_entries and self._puts % COUNT_INTERVAL:
+            return
+        (count,) = conn.execute("SELECT COUNT(*) FROM rows").fetchone()
+        if count > self.max_entries:
+            excess = count - int(self.max_entries * LOW_WATER)
+            conn.execute(
+                "DELETE FROM rows WHERE rowid IN (SELECT rowid FROM rows ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            count -= excess
+        self._entries = count
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM rows")
+            conn.commit()
+            self._entries = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Returns:
+        - dict: Hit and miss counters, hit ratio and current number of entries.
+        """
+        with self._lock:
+            (entries,) = self._connect().execute("SELECT COUNT(*) FROM rows").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "offline": self.offline,
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Returns the process-wide CensusCache configured from the environment.
+
+    - CENSUS_CACHE_PATH: SQLite file (default data/census_cache.sqlite3)
+    - CENSUS_CACHE_MAX_ENTRIES: LRU size limit in block group rows (default 500000)
+    - CENSUS_OFFLINE: set to 1/true to serve from the cache only
+    """
+    global _cache
+    if _cache is None:
+        _cache = CensusCache(
+            os.getenv("CENSUS_CACHE_PATH", "data/census_cache.sqlite3"),
+            max_entries=int(os.getenv("CENSUS_CACHE_MAX_ENTRIES", "500000")),
+            offline=os.getenv("CENSUS_OFFLINE", "").lower() in ("1", "true", "yes"),
+        )
+    return _cache
@@ -1,73 +1,156 @@
 import dotenv
 dotenv.load_dotenv('.env')
 import os
-from census import Census
 import numpy as np
 
-from openai import OpenAI
-
 import requests
 import pandas as pd
 
-ai = OpenAI()
-census = Census(os.getenv('CENSUS_API_KEY'))
-acs5 = census.acs5
+from census_dashboard import aggregation, http_client, metrics
+from census_dashboard.census_cache import get_cache
+from census_dashboard.variable_catalog import get_catalog
 
+# ACS 5-year vintage the block group data is fetched from
+ACS_YEAR = 2022
 
 
-def aggregate_blockgroups(table, block_group_gdf):
-    percent_overlap = block_group_gdf['percent_overlap'] if 'percent_overlap' in block_group_gdf.columns else np.ones(len(block_group_gdf))
-    ucgids = block_group_gdf['GEOIDFQ']
-    bg_data = fetch_census_data(table, ucgids)
-    
-    # parse numbers
-    for col in bg_data.columns:
-        try:
-            bg_data[col] = pd.to_numeric(bg_data[col])
-        except ValueError:
-            pass
-    
-    # dot product every numeric column with percent_overlap
-    data = {}
-    for col in bg_data.columns:
-        col_type = bg_data[col].dtype
-        if col_type == np.float64 or col_type == np.int64:
-            bg_data[col] = bg_data[col].astype(np.float64)
-            data[col] = np.dot(bg_data[col], percent_overlap)
-    
-    vars = variables(table)
-    rows = [
-        {'VarID': key, 'Variable': vars[key]['label'].replace('!!', ' '), 'Value': value}
-        for key, value in data.items()
-    ]
-    
-    df = pd.DataFrame(rows).dropna(how='all')
-    return df
 
+def aggregate_blockgroups(table, block_group_gdf, bg_data=None):
+    """
+    Sums a table over block groups, weighting each block group by its percent_overlap.
 
+    Parameters:
+    - table (str): The table (group) code, e.g. B01001.
+    - block_group_gdf (gpd.GeoDataFrame): Block groups with a GEOIDFQ and optional percent_overlap column.
+    - bg_data (pd.DataFrame): Rows of the table indexed by GEOIDFQ, as returned by
+      fetch_census_tables. Fetched here if not given.
 
-    
+    Returns:
+    - pd.DataFrame: One row per variable with VarID, Variable and Value columns.
+    """
+    df = aggregate_points(table, [block_group_gdf], bg_data)
+    return df.drop(columns='point').dropna(how='all')
 
 
+def aggregate_points(table, block_group_gdfs, bg_data=None, year=ACS_YEAR):
+    """
+    Aggregates a table for many points at once.
 
+    Builds one sparse (points x block groups) overlap matrix and one dense
+    (block groups x variables) matrix and multiplies them, so the cost is a
+    single matrix product however many points there are.
 
-def fetch_census_data(group_name, ucgid_list):
+    Parameters:
+    - table (str): The table (group) code, e.g. B01001.
+    - block_group_gdfs (list): One GeoDataFrame of block groups per point, with a
+      GEOIDFQ and optional percent_overlap column.
+    - bg_data (pd.DataFrame): Rows of the table indexed by GEOIDFQ, as returned by
+      fetch_census_tables. Fetched here if not given.
+    - year (int): The ACS 5-year vintage of the data and the labels.
+
+    Returns:
+    - pd.DataFrame: One row per (point, variable) with point (the position in
+      block_group_gdfs), VarID, Variable and Value columns.
+    """
+    with metrics.span('aggregate'):
+        weights, ucgids = aggregation.overlap_matrix(block_group_gdfs)
+    if bg_data is None:
+        bg_data = fetch_census_tables([table], ucgids, year)[table]
+    with metrics.span('aggregate'):
+        values, columns = aggregation.value_matrix(bg_data, ucgids)
+        estimates = aggregation.weighted_sum(weights, values)
+
+    labels = get_catalog(year).variables(table)
+    variable_names = [labels[key].replace('!!', ' ') for key in columns]
+    return pd.DataFrame({
+        'point': np.repeat(np.arange(len(block_group_gdfs)), len(columns)),
+        'VarID': np.tile(np.asarray(columns, dtype=object), len(block_group_gdfs)),
+        'Variable': np.tile(np.asarray(variable_names, dtype=object), len(block_group_gdfs)),
+        'Value': estimates.ravel(),
+    })
+
+
+def fetch_census_data(group_name, ucgid_list, year=ACS_YEAR):
     """
     Fetches data from the U.S. Census Bureau API for a specified group and list of ucgids.
 
     Parameters:
     - group_name (str): The name of the data group to retrieve.
     - ucgid_list (list): A list of ucgids (Uniform Census Geography Identifiers).
+    - year (int): The ACS 5-year vintage.
 
     Returns:
     - pd.DataFrame: A DataFrame containing the retrieved data.
     """
-    if len(ucgid_list) > 100:
-        chunks = [ucgid_list[i:i + 100] for i in range(0, len(ucgid_list), 100)]
-        return pd.concat([fetch_census_data(group_name, chunk) for chunk in chunks])
-    
-    # Base URL for the Census API
-    base_url = "https://api.census.gov/data/2022/acs/acs5"
+    return fetch_census_tables([group_name], ucgid_list, year)[group_name].reset_index(drop=True)
+
+
+def fetch_census_tables(group_names, ucgid_list, year=ACS_YEAR):
+    """
+    Fetches several groups for a set of block groups with the fewest API requests.
+
+    The ucgids are deduplicated, rows already in the persistent CensusCache are
+    skipped, and the remaining (group, chunk of 100 ucgids) requests for all
+    groups are issued concurrently over the shared connection pool.
+
+    Parameters:
+    - group_names (list): The names of the data groups to retrieve.
+    - ucgid_list (list): ucgids of every block group needed, duplicates allowed.
+    - year (int): The ACS 5-year vintage.
+
+    With CENSUS_DATA_SOURCE=warehouse the rows are read from the local
+    warehouse instead (see warehouse.py). Labels then come only from the local
+    variable catalog, which the warehouse loader fills; a table missing from
+    either raises KeyError rather than going to the network.
+
+    Returns:
+    - dict: Maps each group name to a DataFrame of its rows indexed by GEOIDFQ.
+    """
+    group_names = list(dict.fromkeys(group_names))
+    ucgids = list(dict.fromkeys(ucgid_list))
+    if os.getenv("CENSUS_DATA_SOURCE", "api") == "warehouse":
+        from census_dashboard.warehouse import get_warehouse
+        with metrics.span('warehouse'):
+            return {group_name: get_warehouse().read(year, group_name, ucgids) for group_name in group_names}
+
+    cache = get_cache()
+    with metrics.span('census_cache'):
+        rows = {group_name: cache.get_many(year, group_name, ucgids) for group_name in group_names}
+    hits = sum(len(group_rows) for group_rows in rows.values())
+    metrics.count('census_cache.hits', hits)
+    metrics.count('census_cache.misses', len(group_names) * len(ucgids) - hits)
+
+    jobs = []
+    for group_name in group_names:
+        missing = [ucgid for ucgid in ucgids if ucgid not in rows[group_name]]
+        jobs += [(group_name, missing[i:i + 100]) for i in range(0, len(missing), 100)]
+
+    if jobs:
+        if cache.offline:
+            missing_groups = sorted({group_name for group_name, _ in jobs})
+            raise Exception(f"Offline mode: block groups of {', '.join(missing_groups)} ({year}) are not cached")
+        with metrics.span('census_api'):
+            executor = http_client.get_executor()
+            results = list(executor.map(lambda job: _fetch_census_chunk(job[0], job[1], year), jobs))
+        with metrics.span('census_cache'):
+            for (group_name, _), fetched in zip(jobs, results):
+                cache.put_many(year, group_name, fetched)
+                rows[group_name].update(fetched)
+
+    frames = {}
+    for group_name in group_names:
+        found = [ucgid for ucgid in ucgids if ucgid in rows[group_name]]
+        frames[group_name] = pd.DataFrame(
+            [rows[group_name][ucgid] for ucgid in found],
+            index=pd.Index(found, name='GEOIDFQ'),
+        )
+    return frames
+
+
+def _fetch_census_chunk(group_name, ucgid_list, year):
+    # Base URL for the Census API (CENSUS_API_URL points it at a local stand-in)
+    api_url = os.getenv("CENSUS_API_URL", "https://api.census.gov/data")
+    base_url = f"{api_url}/{year}/acs/acs5"
 
     # Convert the list of ucgids into a comma-separated string
     ucgid_str = ",".join(ucgid_list)
@@ -80,7 +163,7 @@ def fetch_census_data(group_name, ucgid_list):
     }
 
     # Make the API request
-    response = requests.get(base_url, params=params)
+    response = http_client.get(base_url, params=params)
 
     # Check for a successful response
     if response.status_code == 200:
@@ -90,13 +173,10 @@ def fetch_census_data(group_name, ucgid_list):
         # The first row contains the column headers
         headers = data[0]
 
-        # The subsequent rows contain the data
-        rows = data[1:]
-
-        # Create a DataFrame
-        df = pd.DataFrame(rows, columns=headers)
-
-        return df
+        # The subsequent rows contain the data, keyed by the ucgid they describe
+        key = "ucgid" if "ucgid" in headers else "GEO_ID"
+        rows = [dict(zip(headers, values)) for values in data[1:]]
+        return {row[key]: row for row in rows}
     else:
         # Handle errors
         raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
@@ -105,6 +185,9 @@ def fetch_census_data(group_name, ucgid_list):
 def variables(table, year=2023):
     """
     Returns a list of the variables available from this source.
+
+    This always goes to the network and returns the full metadata; use
+    variable_catalog.get_catalog() for label lookups.
     """
     
     variables_url = 'https://api.census.gov/data/%s/acs/acs5/groups/%s.json'
@@ -0,0 +1,79 @@
+import os
+import time
+import logging
+import threading
+
+from census_dashboard import metrics
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_lock = threading.Lock()
+
+# name -> {'count': queries run, 'documents': documents returned, 'seconds': total time}
+query_stats = {}
+
+
+def get_client(uri_env='MONGODB_URI'):
+    """
+    Returns the process-wide MongoClient for the URI in an environment variable.
+
+    Clients are created once and reused, so every request shares one connection
+    pool. Pool sizes come from MONGO_MAX_POOL_SIZE (default 50) and
+    MONGO_MIN_POOL_SIZE (default 0).
+
+    :param uri_env: Name of the environment variable holding the connection URI
+    :return: A pooled MongoClient
+    """
+    with _lock:
+        # MongoClient is not fork-safe, so each process gets its own
+        key = (uri_env, os.getpid())
+        if key not in _clients:
+            from pymongo import MongoClient
+            _clients[key] = MongoClient(
+                os.getenv(uri_env),
+                maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+                minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+            )
+        return _clients[key]
+
+
+def get_collection(database_name, collection_name, uri_env='MONGODB_URI'):
+    return get_client(uri_env)[database_name][collection_name]
+
+
+def _timed(name, cursor):
+    start = time.perf_counter()
+    count = 0
+    try:
+        for document in cursor:
+            count += 1
+            yield document
+    finally:
+        elapsed = time.perf_counter() - start
+        stats = query_stats.setdefault(name, {'count': 0, 'documents': 0, 'seconds': 0.0})
+        stats['count'] += 1
+        stats['documents'] += count
+        stats['seconds'] += elapsed
+        metrics.record(f'mongo.{name}', elapsed)
+        logger.debug("%s returned %d documents in %.1f ms", name, count, elapsed * 1000)
+
+
+def find(collection, query, projection=None, name=None):
+    """
+    Streams the documents matching a query from the cursor, timing the query.
+
+    :param collection: A pymongo Collection
+    :param query: The filter document
+    :param projection: Fields to return; only these are sent over the wire
+    :param name: Name the timing is recorded under (defaults to the collection name)
+    :return: A generator of documents
+    """
+    return _timed(name or collection.name, collection.find(query, projection))
+
+
+def aggregate(collection, pipeline, name=None):
+    """
+    Streams the results of an aggregation pipeline, timing the query.
+    """
+    return _timed(name or collection.name, collection.aggregate(pipeline))
@@ -0,0 +1,23 @@
+import shapely
+
+# Display shapes: simplified to ~10 m and snapped to a 1e-5 degree (~1 m) grid
+DISPLAY_TOLERANCE = 1e-4
+DISPLAY_GRID_SIZE = 1e-5
+
+
+def display_geometry(geom, tolerance=DISPLAY_TOLERANCE, grid_size=DISPLAY_GRID_SIZE):
+    """
+    Light version of an EPSG:4326 geometry for drawing on the map.
+
+    The shape is simplified (keeping it valid) and its coordinates are quantized
+    to a grid, which shrinks the GeoJSON sent to the browser several-fold. It must
+    not be used for overlap math; use the exact geometry for that.
+
+    Only shapely is needed here, so the ingest scripts can use it without
+    loading the rest of the package.
+
+    :param geom: A shapely geometry
+    :return: The simplified geometry, or geom itself if simplifying would empty it
+    """
+    simplified = shapely.set_precision(geom.simplify(tolerance, preserve_topology=True), grid_size)
+    return geom if simplified.is_empty else simplified
@@ -0,0 +1,234 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from census_dashboard import metrics
+
+MODEL = "text-embedding-3-small"
+DIMENSIONS = 1536
+
+
+class EmbeddingStore:
+    """
+    Query embeddings cached in a bounded in-memory LRU backed by a SQLite file,
+    both keyed by (model, text).
+
+    :param path: Location of the SQLite file
+    :param max_entries: Size of the in-memory LRU
+    """
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, text TEXT, vector BLOB, PRIMARY KEY (model, text))"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, model, text):
+        key = (model, text)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return self._lru[key]
+            row = self._connect().execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            self.hits += 1
+            return vector
+
+    def put(self, model, text, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember((model, text), vector)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                (model, text, vector.tobytes()),
+            )
+            conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces the cache misses of concurrent callers into one embeddings request.
+
+    Texts submitted within `window` seconds of each other are sent together, and
+    a text already waiting or in flight is not requested twice.
+
+    :param fetch: Function taking a list of texts and returning their vectors
+    :param window: Seconds to wait for more texts before sending a batch
+    """
+
+    def __init__(self, fetch, window=0.005):
+        self.fetch = fetch
+        self.window = window
+        self._pending = {}
+        self._queue = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def submit(self, texts):
+        """
+        :return: One Future per text, resolving to its vector
+        """
+        with self._lock:
+            futures = []
+            for text in texts:
+                future = self._pending.get(text)
+                if future is None:
+                    future = self._pending[text] = Future()
+                    self._queue.append(text)
+                futures.append(future)
+            if self._queue and not self._scheduled:
+                self._scheduled = True
+                timer = threading.Timer(self.window, self._flush)
+                timer.daemon = True
+                timer.start()
+        return futures
+
+    def _flush(self):
+        with self._lock:
+            batch, self._queue, self._scheduled = self._queue, [], False
+            futures = [self._pending[text] for text in batch]
+        try:
+            vectors = self.fetch(batch)
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        finally:
+            with self._lock:
+                for text in batch:
+                    self._pending.pop(text, None)
+
+
+_client = None
+_store = None
+_batcher = None
+_init_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the shared OpenAI client.
+    """
+    global _client
+    with _init_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI()
+    return _client
+
+
+def hash_embeddings(texts, model=MODEL):
+    """
+    Deterministic local embedding backend for tests: a unit vector seeded by the text.
+    """
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(f"{model}\0{text}".encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(DIMENSIONS)
+        vectors.append((vector / np.linalg.norm(vector)).astype(np.float32))
+    return vectors
+
+
+def openai_embeddings(texts, model=MODEL):
+    response = get_client().embeddings.create(input=texts, model=model)
+    return [np.asarray(d.embedding, dtype=np.float32) for d in response.data]
+
+
+def get_store():
+    """
+    Returns the process-wide EmbeddingStore (EMBEDDING_CACHE_PATH, default
+    data/embedding_cache.sqlite3, with EMBEDDING_CACHE_SIZE entries in memory).
+    """
+    global _store
+    with _init_lock:
+        if _store is None:
+            _store = EmbeddingStore(
+                os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3"),
+                max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+            )
+    return _store
+
+
+def get_batcher():
+    """
+    Returns the process-wide EmbeddingBatcher for the backend named by
+    EMBEDDING_BACKEND ("openai", the default, or "hash").
+    """
+    global _batcher
+    with _init_lock:
+        if _batcher is None:
+            backend = hash_embeddings if os.getenv("EMBEDDING_BACKEND", "openai") == "hash" else openai_embeddings
+            _batcher = EmbeddingBatcher(backend)
+    return _batcher
+
+
+def embed(texts):
+    """
+    Embeds a text or a list of texts with MODEL, going to the backend only for
+    cache misses.
+
+    :return: np.ndarray with one row per text
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    store = get_store()
+    vectors = {}
+    for text in texts:
+        vector = store.get(MODEL, text)
+        if vector is not None:
+            vectors[text] = vector
+
+    missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+    metrics.count('embedding_cache.hits', len(texts) - len(missing))
+    metrics.count('embedding_cache.misses', len(missing))
+    if missing:
+        futures = get_batcher().submit(missing)
+        for text, future in zip(missing, futures):
+            vectors[text] = future.result()
+            store.put(MODEL, text, vectors[text])
+    return np.array([vectors[text] for text in texts])
@@ -0,0 +1,94 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.geometry import Point, Polygon
+
+import census_dashboard.util as util
+
+
+class QueryCircle(NamedTuple):
+    epsg: int  # UTM zone the circle was buffered in
+    point: Point  # center, projected
+    circle: Polygon  # buffer, projected
+    polygon: Polygon  # buffer reprojected to EPSG:4326, for the spatial query
+
+
+@lru_cache(maxsize=None)
+def get_transformers(utm_epsg):
+    """
+    Returns the cached (EPSG:4326 -> UTM, UTM -> EPSG:4326) transformers of a UTM zone.
+    """
+    return (
+        Transformer.from_crs(4326, utm_epsg, always_xy=True),
+        Transformer.from_crs(utm_epsg, 4326, always_xy=True),
+    )
+
+
+def _transform(transformer, geometries):
+    return shapely.transform(geometries, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+def to_utm(geometries, utm_epsg):
+    """
+    Reprojects EPSG:4326 geometries (a geometry or an array of them) into a UTM zone.
+    """
+    return _transform(get_transformers(utm_epsg)[0], geometries)
+
+
+def to_wgs84(geometries, utm_epsg):
+    """
+    Reprojects geometries from a UTM zone back to EPSG:4326.
+    """
+    return _transform(get_transformers(utm_epsg)[1], geometries)
+
+
+@lru_cache(maxsize=1024)
+def query_circle(lng, lat, radius_meters):
+    """
+    Buffers a point by a radius in its UTM zone, reprojecting exactly once each way.
+
+    Results are cached, so the same circle is reused across tables and repeated
+    requests. The returned geometries are shared and must not be modified.
+
+    :return: A QueryCircle
+    """
+    utm_epsg = util.get_utm_epsg(lat, lng)
+    point = to_utm(Point(lng, lat), utm_epsg)
+    circle = point.buffer(radius_meters)
+    return QueryCircle(utm_epsg, point, circle, to_wgs84(circle, utm_epsg))
+
+
+def percent_overlap(geometries, circle):
+    """
+    Share of each geometry's area that lies inside a circle, computed with
+    vectorized shapely operations.
+
+    Both inputs must be in the same projected CRS so areas are in square meters.
+    The circle is prepared once; geometries fully inside it get 1 and geometries
+    outside it get 0 without computing an intersection, so only the block groups
+    crossing the circle's edge pay for the exact overlay.
+
+    :param geometries: Array-like of shapely geometries
+    :param circle: A shapely Polygon
+    :return: np.ndarray of overlap shares between 0 and 1
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    overlap = np.zeros(len(geometries))
+    if len(geometries) == 0:
+        return overlap
+
+    shapely.prepare(circle)
+    areas = shapely.area(geometries)
+    valid = ~shapely.is_empty(geometries) & (areas > 0)
+
+    inside = valid & shapely.contains(circle, geometries)
+    crossing = valid & ~inside & shapely.intersects(circle, geometries)
+
+    overlap[inside] = 1.0
+    if crossing.any():
+        overlap[crossing] = shapely.area(shapely.intersection(geometries[crossing], circle)) / areas[crossing]
+    return overlap
+
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many requests per second are started across threads.
+
+    Parameters:
+    - rate (float): Requests per second; 0 or less disables the limit.
+    - burst (int): Number of requests that may start back to back.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_session = None
+_executor = None
+_rate_limiter = None
+_init_lock = threading.Lock()
+
+
+def max_workers():
+    return int(os.getenv('CENSUS_MAX_WORKERS', '8'))
+
+
+def get_session():
+    """
+    Returns the shared keep-alive Session used for Census API requests.
+
+    Failed requests (connection errors, 429 and 5xx) are retried
+    CENSUS_MAX_RETRIES times with exponential backoff of CENSUS_BACKOFF seconds.
+    """
+    global _session
+    with _init_lock:
+        if _session is None:
+            retry = Retry(
+                total=int(os.getenv('CENSUS_MAX_RETRIES', '3')),
+                backoff_factor=float(os.getenv('CENSUS_BACKOFF', '0.5')),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=('GET',),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers(), max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def get_executor():
+    """
+    Returns the bounded thread pool (CENSUS_MAX_WORKERS threads) used for concurrent requests.
+    """
+    global _executor
+    with _init_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers(), thread_name_prefix='census-api')
+    return _executor
+
+
+def get_rate_limiter():
+    """
+    Returns the shared RateLimiter allowing CENSUS_RATE_LIMIT requests per second (0 = unlimited).
+    """
+    global _rate_limiter
+    with _init_lock:
+        if _rate_limiter is None:
+            rate = float(os.getenv('CENSUS_RATE_LIMIT', '0'))
+            _rate_limiter = RateLimiter(rate, burst=max_workers())
+    return _rate_limiter
+
+
+def get(url, params=None):
+    """
+    Rate-limited GET over the shared pooled session.
+    """
+    get_rate_limiter().acquire()
+    return get_session().get(url, params=params, timeout=float(os.getenv('CENSUS_TIMEOUT', '60')))
+
+
+def _after_fork_in_child():
+    # A forked child inherits the parent's keep-alive sockets and a thread pool
+    # without threads; drop them (without closing the parent's connections)
+    global _session, _executor, _rate_limiter, _init_lock
+    _session = _executor = _rate_limiter = None
+    _init_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def reset():
+    """
+    Drops the shared session, pool and limiter so they are rebuilt from the environment.
+    """
+    global _session, _executor, _rate_limiter
+    with _init_lock:
+        if _session is not None:
+            _session.close()
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _session = _executor = _rate_limiter = None
@@ -96,7 +96,7 @@ def create_layout():
                                     className="mb-3"
                                 ),
                                 html.H4("Points of Interest List", className="card-title"),
-                                html.Ul(id='points-list', className='list-group'),
+                                html.Ul(id='points-list', className='list-group', children=[]),
                                 html.H4("Radius", className="card-title mt-3"),
                                 dbc.InputGroup(
                                     [
@@ -151,6 +151,8 @@ def create_layout():
                                     multiple=False
                                 ),
                                 dbc.Button("Get Data", id="get-data-button", color="primary", className="mt-3"),
+                                dbc.Button("Cancel", id="cancel-data-button", color="secondary", className="mt-3 ms-2", style={"display": "none"}),
+                                dbc.Progress(id="data-progress", className="mt-3", style={"display": "none"}),
                             ]
                         ),
                         className="mb-3"
@@ -164,7 +166,7 @@ def create_layout():
                         children=[
                             dl.TileLayer(),
                             dl.LayerGroup(id="circle-layer"),
-                            dl.LayerGroup(id="prev-circle-layer"),
+                            dl.LayerGroup(id="prev-circle-layer", children=[]),
                             dl.LayerGroup(id="highlight-layer")
                         ],
                         id="map",
@@ -209,7 +211,10 @@ def create_layout():
             ),
             dbc.Row(
                 dbc.Col(
-                    dcc.Loading(html.Div(id="data-table", className="text-center")),
+                    [
+                        html.Div(id="partial-data-table", className="text-center", style={"display": "none"}),
+                        dcc.Loading(html.Div(id="data-table", className="text-center")),
+                    ],
                     width=12,
                     className="mt-3"
                 )
@@ -223,7 +228,9 @@ def create_layout():
             ),
             dcc.Download(id="download-dataframe-csv"),
             dcc.Store(id="state-storage"),
+            # Holds only a handle to the result kept server-side (see result_cache)
             dcc.Store(id="table-data-storage"),
+            dcc.Store(id="session-id", storage_type="session"),
             dcc.Store(id="geo-json-store", data=BLANK_GEOJSON),
             dcc.Store(id="search-output"),
         ],
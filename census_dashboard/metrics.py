@@ -0,0 +1,234 @@
+import os
+import time
+import atexit
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Spans of the request being served, as [(name, seconds)]; None outside a request
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+# Not yet flushed: name -> {'buckets': [...], 'count': n, 'seconds': total} and name -> count
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+_store = None
+_last_flush = time.monotonic()
+
+
+def record(name, seconds):
+    """
+    Records one timing in the process's histograms and the current request's spans.
+    """
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+    with _lock:
+        histogram = _histograms.setdefault(name, {'buckets': [0] * (len(BUCKETS_MS) + 1), 'count': 0, 'seconds': 0.0})
+        histogram['buckets'][bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        histogram['count'] += 1
+        histogram['seconds'] += seconds
+
+
+def count(name, n=1):
+    """
+    Adds n to a counter, e.g. count('census_cache.hits', len(rows)).
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed block as one stage, e.g. `with metrics.span('census_api'):`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect():
+    """
+    Collects the spans recorded in the enclosed block (in this thread or context).
+
+    :return: The list the (name, seconds) spans are appended to
+    """
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def server_timing(spans):
+    """
+    Formats spans as a Server-Timing header value, summing repeated stages.
+    """
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name.replace('.', '-')};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+@contextmanager
+def profile(name):
+    """
+    Profiles the enclosed block with cProfile when PROFILE_DIR is set, writing
+    PROFILE_DIR/<time>-<name>.prof (open it with pstats or snakeviz).
+    """
+    directory = os.getenv('PROFILE_DIR')
+    if not directory:
+        yield
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+        profiler.dump_stats(os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{safe_name}.prof"))
+
+
+def get_store():
+    """
+    Returns the diskcache the histograms and counters of every process are merged
+    into (METRICS_DIR, default data/metrics), so /metrics covers all web workers
+    and the background job processes.
+    """
+    global _store
+    if _store is None:
+        import diskcache
+        _store = diskcache.Cache(os.getenv('METRICS_DIR', 'data/metrics'))
+    return _store
+
+
+def flush():
+    """
+    Merges this process's histograms and counters into the shared store and resets them.
+    """
+    global _last_flush
+    with _lock:
+        _last_flush = time.monotonic()
+        histograms, counters = dict(_histograms), dict(_counters)
+        _histograms.clear()
+        _counters.clear()
+    if not histograms and not counters:
+        return
+
+    store = get_store()
+    with store.transact():
+        for name, histogram in histograms.items():
+            total = store.get(('histogram', name))
+            if total is None:
+                total = histogram
+            else:
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+                total['count'] += histogram['count']
+                total['seconds'] += histogram['seconds']
+            store.set(('histogram', name), total)
+        for name, n in counters.items():
+            store.set(('counter', name), store.get(('counter', name), 0) + n)
+
+
+def maybe_flush():
+    """
+    Flushes if METRICS_FLUSH_INTERVAL seconds (default 5) have passed since the
+    last flush, so serving a request rarely waits on the store's write lock.
+    """
+    if time.monotonic() - _last_flush >= float(os.getenv('METRICS_FLUSH_INTERVAL', '5')):
+        flush()
+
+
+def snapshot():
+    """
+    Returns the merged histograms, counters and cache hit ratios of all processes.
+
+    Other web workers' metrics appear once they flush, at most
+    METRICS_FLUSH_INTERVAL seconds later.
+    """
+    flush()
+    store = get_store()
+    histograms, counters = {}, {}
+    for kind, name in store.iterkeys():
+        if kind == 'histogram':
+            histogram = store.get((kind, name))
+            histograms[name] = {
+                'count': histogram['count'],
+                'mean_ms': histogram['seconds'] * 1000 / histogram['count'],
+                'buckets_ms': dict(zip([*map(str, BUCKETS_MS), '+Inf'], histogram['buckets'])),
+            }
+        elif kind == 'counter':
+            counters[name] = store.get((kind, name))
+
+    hit_ratios = {}
+    for name in counters:
+        if name.endswith('.hits'):
+            cache = name[:-len('.hits')]
+            lookups = counters[name] + counters.get(f'{cache}.misses', 0)
+            hit_ratios[cache] = counters[name] / lookups if lookups else 0.0
+    return {'histograms': histograms, 'counters': counters, 'hit_ratios': hit_ratios}
+
+
+def reset():
+    """Clears all recorded metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+    get_store().clear()
+
+
+def init_app(server):
+    """
+    Instruments a Flask server: every response gets a Server-Timing header with
+    the stages timed while serving it, and GET /metrics returns snapshot() as JSON.
+
+    Background callbacks run in their own processes, so their stages show up in
+    /metrics but not in the Server-Timing of the request that polls for them.
+    """
+    from flask import g, jsonify, request
+
+    @server.before_request
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_token = _request_spans.set([])
+        g.metrics_profile = None
+        if os.getenv('PROFILE_DIR') and request.path != '/metrics':
+            g.metrics_profile = profile(request.path.strip('/') or 'index')
+            g.metrics_profile.__enter__()
+
+    @server.after_request
+    def _finish_request(response):
+        spans = list(_request_spans.get() or [])
+        total = time.perf_counter() - g.pop('metrics_start', time.perf_counter())
+        response.headers['Server-Timing'] = server_timing(spans + [('total', total)])
+        record(f'http.{request.endpoint}', total)
+        return response
+
+    @server.teardown_request
+    def _teardown_request(_):
+        if g.get('metrics_profile') is not None:
+            g.metrics_profile.__exit__(None, None, None)
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            _request_spans.reset(token)
+        maybe_flush()
+
+    # Whatever is left since the last periodic flush
+    atexit.register(flush)
+
+    @server.route('/metrics')
+    def _metrics():
+        return jsonify(snapshot())
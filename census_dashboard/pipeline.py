@@ -0,0 +1,157 @@
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import shape
+
+import census_dashboard.util as util
+import census_dashboard.census_lib as cl
+import census_dashboard.geometry as geometry
+import census_dashboard.metrics as metrics
+import census_dashboard.result_cache as result_cache
+
+
+def find_block_groups(lng, lat, radius_meters):
+    """
+    Finds the block groups overlapping a circle and how much of each lies inside it.
+
+    :param lng: Longitude of the center
+    :param lat: Latitude of the center
+    :param radius_meters: Radius of the circle
+    :return: GeoDataFrame (EPSG:4326) with GEOIDFQ, percent_overlap, the exact
+        geometry and the light display_geometry, for block groups with overlap > 0
+    """
+    # Buffer in projected space (cached per point and radius)
+    with metrics.span('query_circle'):
+        query_circle = geometry.query_circle(lng, lat, radius_meters)
+
+    # Find intersecting block groups
+    db_results = util.find_intersecting_features('census-dashboard', 'block-group-geojson', query_circle.polygon.__geo_interface__, display=True)
+    db_results = [
+        {
+            'geometry': shape(doc['geometry']),
+            # light shape for the map, exact one for the overlap
+            'display_geometry': shape(doc['display_geometry']) if doc.get('display_geometry') else None,
+            **doc['properties']
+        }
+        for doc in db_results
+    ]
+    block_group_gdf = gpd.GeoDataFrame(db_results, columns=['geometry', 'display_geometry', 'GEOIDFQ'], geometry='geometry', crs="EPSG:4326")
+
+    # Overlap, measured in the projected CRS the circle was buffered in
+    with metrics.span('reproject'):
+        projected_geometries = geometry.to_utm(block_group_gdf.geometry.to_numpy(), query_circle.epsg)
+    with metrics.span('overlap'):
+        block_group_gdf['percent_overlap'] = geometry.percent_overlap(projected_geometries, query_circle.circle)
+    return block_group_gdf[block_group_gdf['percent_overlap'] > 0]
+
+
+def cached_block_groups(lng, lat, radius_meters):
+    """
+    find_block_groups, memoized in the result cache across requests.
+    """
+    cache = result_cache.get_cache()
+    key = result_cache.block_groups_key(lng, lat, radius_meters)
+    block_group_gdf = cache.get(key)
+    metrics.count('result_cache.hits' if block_group_gdf is not None else 'result_cache.misses')
+    if block_group_gdf is None:
+        block_group_gdf = find_block_groups(lng, lat, radius_meters)
+        cache.set(key, block_group_gdf)
+    return block_group_gdf
+
+
+def table_estimates(table_code, block_group_gdfs, bg_data=None, year=cl.ACS_YEAR):
+    """
+    Aggregates the estimate variables of a table for every point in one matrix product.
+
+    :param table_code: The table (group) code, e.g. B01001
+    :param block_group_gdfs: One find_block_groups result per point
+    :param bg_data: Rows of the table indexed by GEOIDFQ (fetched if not given)
+    :param year: The ACS 5-year vintage
+    :return: DataFrame with point (position in block_group_gdfs), VarID, Variable and a numeric Value
+    """
+    data_df = cl.aggregate_points(table_code, block_group_gdfs, bg_data, year)
+    return data_df[data_df["VarID"].str.endswith("E")]
+
+
+def iter_table_estimates(table_codes, points, block_group_gdfs, year=cl.ACS_YEAR):
+    """
+    table_estimates for several tables, with each (point, table) memoized in
+    the result cache.
+
+    The cache is checked for every table first, then all tables with missing
+    points are fetched in one fetch_census_tables call for the union of those
+    points' block groups, so N tables cost one concurrent round of requests.
+    Only the missing points are aggregated.
+
+    :param table_codes: The table (group) codes, e.g. ['B01001', 'B19013']
+    :param points: (lng, lat, radius_meters) of each point
+    :param block_group_gdfs: One find_block_groups result per point
+    :param year: The ACS 5-year vintage
+    :return: Yields (table_code, DataFrame with point, VarID, Variable and a numeric Value) in table order
+    """
+    cache = result_cache.get_cache()
+    keys, rows, missing = {}, {}, {}
+    for table_code in table_codes:
+        keys[table_code] = [result_cache.estimates_key(lng, lat, radius, table_code, year) for lng, lat, radius in points]
+        rows[table_code] = [cache.get(key) for key in keys[table_code]]
+        missing[table_code] = [i for i, point_rows in enumerate(rows[table_code]) if point_rows is None]
+        metrics.count('result_cache.hits', len(points) - len(missing[table_code]))
+        metrics.count('result_cache.misses', len(missing[table_code]))
+
+    missing_tables = [table_code for table_code in table_codes if missing[table_code]]
+    tables_data = {}
+    if missing_tables:
+        missing_points = sorted({i for table_code in missing_tables for i in missing[table_code]})
+        ucgids = pd.concat([block_group_gdfs[i]['GEOIDFQ'] for i in missing_points])
+        tables_data = cl.fetch_census_tables(missing_tables, ucgids, year)
+
+    for table_code in table_codes:
+        table_rows = rows[table_code]
+        if missing[table_code]:
+            gdfs = [block_group_gdfs[i] for i in missing[table_code]]
+            data_df = table_estimates(table_code, gdfs, tables_data[table_code], year)
+            for j, i in enumerate(missing[table_code]):
+                table_rows[i] = data_df[data_df['point'] == j].drop(columns='point')
+                cache.set(keys[table_code][i], table_rows[i])
+        yield table_code, pd.concat([point_rows.assign(point=i) for i, point_rows in enumerate(table_rows)], ignore_index=True)
+
+
+def cached_table_estimates(table_code, points, block_group_gdfs, year=cl.ACS_YEAR):
+    """
+    iter_table_estimates for a single table.
+
+    :return: DataFrame with point, VarID, Variable and a numeric Value
+    """
+    return next(iter_table_estimates([table_code], points, block_group_gdfs, year))[1]
+
+
+def pivot_estimates(frames):
+    """
+    Pivots table_estimates results into one row per point and one column per variable.
+    """
+    with metrics.span('pivot'):
+        big_df = pd.concat(frames, ignore_index=True)
+        return big_df.pivot_table(
+            index='point_name',
+            columns='Variable',
+            values='Value',
+            aggfunc='first',
+            dropna=False
+        ).reset_index()
+
+
+def highlight_geo_json(block_group_gdfs):
+    """
+    FeatureCollection of the block groups to draw on the map, using their light
+    display shapes and carrying GEOIDFQ and percent_overlap as properties.
+    """
+    with metrics.span('highlight'):
+        final_block_group_gdf = pd.concat(block_group_gdfs, ignore_index=True)
+        display_geometries = [
+            display if display is not None else exact
+            for display, exact in zip(final_block_group_gdf['display_geometry'], final_block_group_gdf.geometry)
+        ]
+        return gpd.GeoDataFrame(
+            final_block_group_gdf[['GEOIDFQ', 'percent_overlap']].round({'percent_overlap': 3}),
+            geometry=display_geometries,
+            crs="EPSG:4326"
+        ).__geo_interface__
@@ -0,0 +1,85 @@
+import os
+
+_cache = None
+
+
+def get_cache():
+    """
+    Returns the disk-backed result cache shared by the web and background worker processes.
+
+    Entries are evicted least recently used first once the cache grows past
+    RESULT_CACHE_SIZE_LIMIT bytes (default 512 MB). It lives in RESULT_CACHE_DIR
+    (default data/result-cache).
+    """
+    global _cache
+    if _cache is None:
+        import diskcache
+        _cache = diskcache.Cache(
+            os.getenv("RESULT_CACHE_DIR", "data/result-cache"),
+            size_limit=int(os.getenv("RESULT_CACHE_SIZE_LIMIT", str(512 * 2**20))),
+            eviction_policy="least-recently-used",
+        )
+    return _cache
+
+
+def block_groups_key(lng, lat, radius_meters):
+    """Key of a point's overlapping block groups (its overlap set)."""
+    return ("block_groups", float(lng), float(lat), float(radius_meters))
+
+
+def estimates_key(lng, lat, radius_meters, table_code, year):
+    """Key of a point's aggregated rows for one table and ACS vintage."""
+    return ("estimates", float(lng), float(lat), float(radius_meters), table_code, int(year))
+
+
+_store = None
+
+
+def get_result_store():
+    """
+    Returns the disk-backed store of finished search results, shared by the
+    background job that computes a result and the web worker that serves it.
+
+    Each browser session keeps only its latest result, which expires after
+    RESULT_STORE_TTL seconds (default 3600). Least recently used results are
+    evicted once the store grows past RESULT_STORE_SIZE_LIMIT bytes (default
+    256 MB). It lives in RESULT_STORE_DIR (default data/result-store).
+    """
+    global _store
+    if _store is None:
+        import diskcache
+        _store = diskcache.Cache(
+            os.getenv("RESULT_STORE_DIR", "data/result-store"),
+            size_limit=int(os.getenv("RESULT_STORE_SIZE_LIMIT", str(256 * 2**20))),
+            eviction_policy="least-recently-used",
+        )
+    return _store
+
+
+def put_result(session_id, frame):
+    """
+    Stores a session's result, replacing its previous one.
+
+    :return: The handle the browser keeps instead of the data
+    """
+    import uuid
+    handle = {"session": session_id, "token": uuid.uuid4().hex}
+    get_result_store().set(
+        ("result", session_id),
+        (handle["token"], frame),
+        expire=float(os.getenv("RESULT_STORE_TTL", "3600")),
+    )
+    return handle
+
+
+def get_result(handle):
+    """
+    Returns the result a handle refers to, or None once it has expired, been
+    evicted or been replaced by a newer result of the session.
+    """
+    if not handle:
+        return None
+    stored = get_result_store().get(("result", handle["session"]))
+    if stored is None or stored[0] != handle["token"]:
+        return None
+    return stored[1]
@@ -0,0 +1,222 @@
+import io
+import os
+import csv
+import json
+import shutil
+import tempfile
+import logging
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, jsonify, request, stream_with_context
+
+DEFAULT_RADIUS = 5 * 1609.34
+SITE_COLUMNS = ['name', 'lng', 'lat', 'radius']
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def max_workers():
+    return int(os.getenv("SITE_ANALYSIS_WORKERS", "4"))
+
+
+def get_executor():
+    """
+    Returns the pool site chunks are analyzed on (SITE_ANALYSIS_WORKERS threads, default 4).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max_workers())
+    return _executor
+
+
+def parse_geojson(geo_json):
+    """
+    Yields the sites of a FeatureCollection of points, with radii in meters.
+    Features that are not points come back with an error.
+    """
+    for i, feature in enumerate(geo_json.get('features', [])):
+        properties = feature.get('properties') or {}
+        name = properties.get('name', f"Site {i + 1}")
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            yield {'name': name, 'error': "Only Point features are supported"}
+            continue
+        lng, lat = geometry['coordinates'][:2]
+        yield {'name': name, 'lng': float(lng), 'lat': float(lat), 'radius': float(properties.get('radius', DEFAULT_RADIUS))}
+
+
+def parse_csv(lines):
+    """
+    Yields the sites of a CSV with name, lat (or latitude), lng (or lon,
+    longitude) and radius (meters), radius_miles or radius_km columns.
+    Rows that cannot be parsed come back with an error.
+    """
+    for i, row in enumerate(csv.DictReader(lines)):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        name = row.get('name') or f"Site {i + 1}"
+        try:
+            lat = float(row.get('lat') or row['latitude'])
+            lng = float(row.get('lng') or row.get('lon') or row['longitude'])
+            if row.get('radius'):
+                radius = float(row['radius'])
+            elif row.get('radius_miles'):
+                radius = float(row['radius_miles']) * 1609.34
+            elif row.get('radius_km'):
+                radius = float(row['radius_km']) * 1000
+            else:
+                radius = DEFAULT_RADIUS
+        except (KeyError, TypeError, ValueError):
+            yield {'name': name, 'error': "Could not read lat, lng and radius"}
+            continue
+        yield {'name': name, 'lng': lng, 'lat': lat, 'radius': radius}
+
+
+def estimate_columns(table_codes, year=None):
+    """
+    Returns the estimate variables of the tables, in output column order.
+
+    The labels come from the catalog of the data vintage (default ACS_YEAR).
+    """
+    from census_dashboard.aggregation import GEO_COLUMNS
+    from census_dashboard.census_lib import ACS_YEAR
+    from census_dashboard.variable_catalog import get_catalog
+
+    catalog = get_catalog(year or ACS_YEAR)
+    return [
+        name
+        for table_code in table_codes
+        for name in sorted(catalog.variables(table_code))
+        if name.endswith('E') and name not in GEO_COLUMNS
+    ]
+
+
+def _analyze_chunk(sites, table_codes, columns):
+    import pandas as pd
+    import census_dashboard.pipeline as pipeline
+
+    valid = [site for site in sites if 'error' not in site]
+    points = [(site['lng'], site['lat'], site['radius']) for site in valid]
+    block_group_gdfs = [pipeline.cached_block_groups(*point) for point in points]
+
+    values = pd.DataFrame(index=range(len(valid)), columns=columns, dtype=float)
+    if valid:
+        for _, data_df in pipeline.iter_table_estimates(table_codes, points, block_group_gdfs):
+            table_values = data_df.pivot_table(index='point', columns='VarID', values='Value', aggfunc='first', dropna=False)
+            values.update(table_values.reindex(columns=[c for c in table_values.columns if c in values.columns]))
+    return iter(values.astype(object).where(values.notna(), None).to_dict('records'))
+
+
+def analyze_chunk(sites, table_codes, columns):
+    """
+    Runs the block group search, overlap and aggregation for a chunk of sites,
+    fetching all tables at once for the whole chunk. If that fails, every site
+    of the chunk gets the error instead of estimates.
+
+    :return: One dict per site with its SITE_COLUMNS, the estimates and an error (or None)
+    """
+    try:
+        estimates, chunk_error = _analyze_chunk(sites, table_codes, columns), None
+    except Exception as e:
+        logger.exception("Site analysis failed for a chunk of %d sites", len(sites))
+        estimates, chunk_error = None, f"Analysis failed: {e}"
+
+    rows = []
+    for site in sites:
+        row = {column: site.get(column) for column in SITE_COLUMNS}
+        if 'error' in site or chunk_error:
+            row.update(dict.fromkeys(columns), error=site.get('error', chunk_error))
+        else:
+            row.update(next(estimates), error=None)
+        rows.append(row)
+    return rows
+
+
+def analyze(sites, table_codes, columns, chunk_size=None):
+    """
+    Analyzes sites chunk by chunk in parallel, yielding rows in input order.
+
+    At most twice as many chunks as workers are read ahead or held in memory,
+    so memory stays bounded however many sites there are.
+    """
+    chunk_size = chunk_size or int(os.getenv("SITE_ANALYSIS_CHUNK_SIZE", "50"))
+    executor = get_executor()
+    window = 2 * max_workers()
+    pending = deque()
+    sites = iter(sites)
+    while True:
+        chunk = list(itertools.islice(sites, chunk_size))
+        if chunk:
+            pending.append(executor.submit(analyze_chunk, chunk, table_codes, columns))
+        if pending and (len(pending) >= window or not chunk):
+            yield from pending.popleft().result()
+        elif not chunk:
+            return
+
+
+def to_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def to_csv(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SITE_COLUMNS + columns + ['error'])
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def read_sites():
+    """
+    Reads the sites of the current request: an uploaded "file" or the request
+    body, as CSV (by content type or .csv file name) or GeoJSON. CSV is read
+    as a stream; GeoJSON has to be parsed whole.
+    """
+    upload = request.files.get('file')
+    stream = request.stream
+    if upload:
+        # Flask closes uploads when the view returns, before the response is streamed
+        stream = tempfile.TemporaryFile()
+        shutil.copyfileobj(upload.stream, stream)
+        stream.seek(0)
+    mimetype = (upload.mimetype if upload else request.mimetype) or ''
+    filename = (upload.filename if upload else '') or ''
+    if 'csv' in mimetype or filename.lower().endswith('.csv'):
+        return parse_csv(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    return parse_geojson(json.load(stream))
+
+
+def init_app(server):
+    """
+    Adds POST /api/site-analysis to a Flask server.
+
+    Send points with radii as a GeoJSON FeatureCollection or a CSV (see
+    parse_geojson and parse_csv), either as the request body or as a "file"
+    upload, with the table codes in ?tables=B01001,B19013. Rows are streamed
+    back as each chunk of sites finishes, as NDJSON or, with ?format=csv or
+    Accept: text/csv, as CSV. Each row holds the site, one column per estimate
+    variable (VarID) and an error for sites that could not be analyzed.
+    """
+
+    @server.route('/api/site-analysis', methods=['POST'])
+    def site_analysis():
+        table_codes = [tc.strip() for tc in request.values.get('tables', '').split(',') if tc.strip()]
+        if not table_codes:
+            return jsonify(error="No table codes given; pass ?tables=B01001,..."), 400
+        try:
+            columns = estimate_columns(table_codes)
+            sites = read_sites()
+        except Exception as e:
+            return jsonify(error=f"Invalid request: {e}"), 400
+
+        rows = analyze(sites, table_codes, columns)
+        if request.values.get('format') == 'csv' or request.accept_mimetypes.best == 'text/csv':
+            return Response(stream_with_context(to_csv(rows, columns)), mimetype='text/csv')
+        return Response(stream_with_context(to_ndjson(rows)), mimetype='application/x-ndjson')
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+
+import numpy as np
+import shapely
+from shapely.geometry import shape, mapping
+
+from census_dashboard.display import display_geometry
+
+
+class SpatialIndex:
+    """
+    In-process block group geometry store answering intersection queries.
+
+    Geometries live as WKB in a memory-mapped file, so only the candidates of a
+    query are ever read and decoded. Their bounding boxes are packed into a
+    shapely STRtree when the store is opened.
+
+    A store is a directory written by build_index containing:
+    - wkb.npy: every geometry's WKB, concatenated (uint8)
+    - offsets.npy: start of each geometry in wkb.npy, plus the end (int64)
+    - bounds.npy: (n x 4) minx, miny, maxx, maxy (float64)
+    - geoids.npy: GEOIDFQ of each geometry (fixed-width unicode)
+    - display_wkb.npy, display_offsets.npy: the light display shapes, same layout
+
+    Parameters:
+    - path (str): The store directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.wkb = np.load(os.path.join(path, 'wkb.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.bounds = np.load(os.path.join(path, 'bounds.npy'), mmap_mode='r')
+        self.geoids = np.load(os.path.join(path, 'geoids.npy'), mmap_mode='r')
+        self.display_wkb = np.load(os.path.join(path, 'display_wkb.npy'), mmap_mode='r')
+        self.display_offsets = np.load(os.path.join(path, 'display_offsets.npy'), mmap_mode='r')
+        self.tree = shapely.STRtree(shapely.box(*np.asarray(self.bounds).T))
+
+    def __len__(self):
+        return len(self.geoids)
+
+    def geometries(self, indices, display=False):
+        """
+        Decodes the exact (or, with display, the light) geometries at the given positions.
+        """
+        wkb, offsets = (self.display_wkb, self.display_offsets) if display else (self.wkb, self.offsets)
+        return shapely.from_wkb([bytes(wkb[offsets[i]:offsets[i + 1]]) for i in indices])
+
+    def query(self, geometry):
+        """
+        Finds the geometries intersecting a circle, polygon or any other geometry.
+
+        Parameters:
+        - geometry: A GeoJSON geometry dict or a shapely geometry, in EPSG:4326.
+
+        Returns:
+        - np.ndarray: Positions of the intersecting geometries.
+        - np.ndarray: The intersecting shapely geometries.
+        """
+        if isinstance(geometry, dict):
+            geometry = shape(geometry)
+        candidates = np.sort(self.tree.query(geometry))
+        geometries = self.geometries(candidates)
+        shapely.prepare(geometry)
+        hits = shapely.intersects(geometry, geometries)
+        return candidates[hits], geometries[hits]
+
+    def find_intersecting_features(self, geojson, display=False):
+        """
+        Same result shape as a MongoDB $geoIntersects query on the GeoJSON collection.
+        """
+        indices, geometries = self.query(geojson)
+        documents = [
+            {'geometry': mapping(geom), 'properties': {'GEOIDFQ': str(self.geoids[i])}}
+            for i, geom in zip(indices, geometries)
+        ]
+        if display:
+            for document, geom in zip(documents, self.geometries(indices, display=True)):
+                document['display_geometry'] = mapping(geom)
+        return documents
+
+
+def build_index(features, path):
+    """
+    Writes a SpatialIndex store from GeoJSON features with a GEOIDFQ property.
+
+    Features without a display_geometry get one from display.display_geometry.
+
+    Parameters:
+    - features (iterable): GeoJSON features, e.g. from shapefiles or the MongoDB collection.
+    - path (str): The store directory to create.
+    """
+    chunks, offsets, bounds, geoids = [], [0], [], []
+    display_chunks, display_offsets = [], [0]
+    for feature in features:
+        geom = shape(feature['geometry'])
+        wkb = shapely.to_wkb(geom)
+        chunks.append(np.frombuffer(wkb, dtype=np.uint8))
+        offsets.append(offsets[-1] + len(wkb))
+        bounds.append(geom.bounds)
+        geoids.append(feature['properties']['GEOIDFQ'])
+
+        if feature.get('display_geometry'):
+            display_wkb = shapely.to_wkb(shape(feature['display_geometry']))
+        else:
+            display_wkb = shapely.to_wkb(display_geometry(geom))
+        display_chunks.append(np.frombuffer(display_wkb, dtype=np.uint8))
+        display_offsets.append(display_offsets[-1] + len(display_wkb))
+
+    os.makedirs(path, exist_ok=True)
+    for name, parts, ends in (('', chunks, offsets), ('display_', display_chunks, display_offsets)):
+        np.save(os.path.join(path, f'{name}wkb.npy'), np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8))
+        np.save(os.path.join(path, f'{name}offsets.npy'), np.asarray(ends, dtype=np.int64))
+    np.save(os.path.join(path, 'bounds.npy'), np.asarray(bounds, dtype=np.float64).reshape(-1, 4))
+    np.save(os.path.join(path, 'geoids.npy'), np.asarray(geoids, dtype=str))
+
+
+_indexes = {}
+
+
+def get_index(collection_name):
+    """
+    Returns the process-wide SpatialIndex for a collection, stored in
+    SPATIAL_INDEX_DIR/<collection_name> (default data/spatial-index/).
+    """
+    if collection_name not in _indexes:
+        directory = os.getenv('SPATIAL_INDEX_DIR', 'data/spatial-index')
+        _indexes[collection_name] = SpatialIndex(os.path.join(directory, collection_name))
+    return _indexes[collection_name]
+
+
+def _iter_shapefile_features(directory_path):
+    import shapefile  # pyshp library
+
+    for filename in sorted(os.listdir(directory_path)):
+        if filename.endswith('.shp'):
+            with shapefile.Reader(os.path.join(directory_path, filename)) as shp:
+                for sr in shp.iterShapeRecords():
+                    yield {'geometry': sr.shape.__geo_interface__, 'properties': sr.record.as_dict()}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python -m census_dashboard.spatial_index <shapefile_directory> <index_directory>")
+        sys.exit(1)
+    build_index(_iter_shapefile_features(sys.argv[1]), sys.argv[2])
+    print(json.dumps({'path': sys.argv[2], 'features': len(SpatialIndex(sys.argv[2]))}))
@@ -1,11 +1,9 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from openai import OpenAI
-import numpy as np
 import os
 
-from pymongo import MongoClient
+from census_dashboard import db, embeddings, metrics, spatial_index, vector_index
 
 def get_utm_epsg(lat, lon):
     """Return the EPSG code for the UTM zone corresponding to lat/lon."""
@@ -17,49 +15,58 @@ def get_utm_epsg(lat, lon):
     return epsg
 
 def embed(texts):
-    ai_client = OpenAI()
-    response = ai_client.embeddings.create(
-        input=texts,
-        model="text-embedding-3-small"
-    )
-    return np.array([d.embedding for d in response.data])
+    """Embed a text or list of texts, served from the embedding cache when possible (see embeddings)."""
+    with metrics.span('embed'):
+        return embeddings.embed(texts)
 
 
-def find_intersecting_features(database_name, collection_name, geojson):
+def find_intersecting_features(database_name, collection_name, geojson, fields=('GEOIDFQ',), display=False):
     """
     Find all documents in a collection that intersect with a given GeoJSON object.
     
     :param database_name: Name of the database
     :param collection_name: Name of the collection
     :param geojson: A GeoJSON object to check intersection with
-    :param mongo_uri: MongoDB connection URI (defaults to localhost if not provided)
-    :return: A list of documents that intersect with the given GeoJSON
+    :param fields: Properties to return alongside the geometry
+    :param display: Also return the simplified display_geometry stored at ingest
+    :return: An iterable of documents that intersect with the given GeoJSON
+
+    With SPATIAL_ENGINE=local the query is answered in-process by the
+    spatial_index store for the collection instead of MongoDB.
     """
-    client = MongoClient(os.getenv('MONGODB_URI'))
-    db = client[database_name]
-    collection = db[collection_name]
+    if os.getenv('SPATIAL_ENGINE', 'mongo') == 'local':
+        with metrics.span('spatial_index'):
+            return spatial_index.get_index(collection_name).find_intersecting_features(geojson, display=display)
+
+    collection = db.get_collection(database_name, collection_name)
     
-    # Perform the geospatial query using $geoIntersects
-    intersecting_documents = collection.find(
+    # Perform the geospatial query using $geoIntersects, returning only the needed fields
+    projection = {'_id': 0, 'geometry': 1, **{f'properties.{field}': 1 for field in fields}}
+    if display:
+        projection['display_geometry'] = 1
+    return db.find(
+        collection,
         {
             "geometry": {
                 "$geoIntersects": {
                     "$geometry": geojson
                 }
             }
-        }
+        },
+        projection,
+        name='find_intersecting_features',
     )
-    # Collect intersecting results
-    results = list(intersecting_documents)
-    
-    return results
 
 
 def semantic_search_2023_tables(query, k=10):
+    # TABLE_SEARCH_ENGINE=local searches the embeddings in-process instead of Atlas
+    if os.getenv('TABLE_SEARCH_ENGINE', 'atlas') == 'local':
+        query_embedding = embed(query)[0]
+        with metrics.span('vector_search'):
+            return vector_index.get_index().search(query_embedding, k)
+
     # Connect to MongoDB Atlas
-    client = MongoClient(os.getenv('ATLAS_URI'))
-    db = client['census-dashboard']
-    collection = db['2023-tables']
+    collection = db.get_collection('census-dashboard', '2023-tables', uri_env='ATLAS_URI')
 
     # Compute the query embedding
     query_embedding = embed(query)[0].tolist()  # Replace with your embedding function
@@ -87,5 +94,5 @@ def semantic_search_2023_tables(query, k=10):
         }
     ]
 
-    results = list(collection.aggregate(pipeline))
-    return results
\ No newline at end of file
+    results = list(db.aggregate(collection, pipeline, name='semantic_search_2023_tables'))
+    return results
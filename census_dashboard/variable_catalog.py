@@ -0,0 +1,154 @@
+import os
+import json
+import pickle
+import threading
+
+import requests
+
+
+GROUP_URL = '%s/%s/acs/acs5/groups/%s.json'
+VARIABLES_URL = '%s/%s/acs/acs5/variables.json'
+
+
+def _api_url():
+    # CENSUS_API_URL points the catalog at a local stand-in, as in census_lib
+    return os.getenv('CENSUS_API_URL', 'https://api.census.gov/data')
+
+
+class VariableCatalog:
+    """
+    Local catalog of ACS variable labels for one vintage.
+
+    Tables are stored as {table: (concept, {variable: label})} and persisted
+    with pickle, so the whole catalog loads at startup in a few milliseconds.
+    Tables missing from the catalog are fetched once from the Census API and
+    memoized, both in memory and on disk, unless the catalog is offline.
+
+    Parameters:
+    - path (str): Location of the pickled catalog.
+    - year (int): The ACS 5-year vintage the labels belong to.
+    - offline (bool): Raise KeyError for missing tables instead of fetching them.
+    """
+
+    def __init__(self, path, year=2023, offline=False):
+        self.path = path
+        self.year = year
+        self.offline = offline
+        self.tables = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            self.tables = pickle.load(f)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def add_group(self, table, group_json):
+        """
+        Adds a table from the contents of a groups/<table>.json response.
+        """
+        group_vars = group_json['variables']
+        concept = next((v.get('concept') for v in group_vars.values() if v.get('concept')), None)
+        self.tables[table] = (concept, {name: v['label'] for name, v in group_vars.items()})
+
+    def build(self):
+        """
+        Bulk-loads every table of the vintage from a single variables.json request.
+        """
+        params = {"key": os.getenv("CENSUS_API_KEY")}
+        resp = requests.get(VARIABLES_URL % (_api_url(), self.year), params=params)
+        resp.raise_for_status()
+        tables = {}
+        for name, v in resp.json()['variables'].items():
+            table = v.get('group')
+            if not table or table == 'N/A':
+                continue
+            concept, labels = tables.setdefault(table, (v.get('concept'), {}))
+            labels[name] = v['label']
+        with self._lock:
+            self.tables = tables
+            self.save()
+
+    def build_from_files(self, directory):
+        """
+        Bulk-loads tables from a directory of saved groups/<table>.json files.
+        """
+        with self._lock:
+            for filename in os.listdir(directory):
+                if filename.endswith('.json'):
+                    with open(os.path.join(directory, filename)) as f:
+                        self.add_group(filename[:-len('.json')], json.load(f))
+            self.save()
+
+    def fetch_group(self, table):
+        """
+        Fetches a table's groups/<table>.json from the Census API and adds it.
+        """
+        params = {"key": os.getenv("CENSUS_API_KEY")}
+        resp = requests.get(GROUP_URL % (_api_url(), self.year, table), params=params)
+        resp.raise_for_status()
+        with self._lock:
+            self.add_group(table, resp.json())
+            self.save()
+
+    def variables(self, table):
+        """
+        Returns:
+        - dict: Maps every variable of the table to its label.
+
+        Raises:
+        - KeyError: If the catalog is offline and the table is not in it.
+        """
+        if table not in self.tables:
+            if self.offline:
+                raise KeyError(
+                    f"{table} ({self.year}) is not in the variable catalog {self.path}; load its labels with "
+                    f"python -m census_dashboard.warehouse {self.year} {table} ..."
+                )
+            self.fetch_group(table)
+        return self.tables[table][1]
+
+    def label(self, name):
+        """
+        Returns the label of a variable (e.g. B01001_002E) or the concept of a table (e.g. B01001).
+        """
+        table = name.split('_')[0]
+        if name == table:
+            self.variables(table)
+            return self.tables[table][0]
+        return self.variables(table).get(name)
+
+
+_catalogs = {}
+
+
+def get_catalog(year=2023):
+    """
+    Returns the process-wide VariableCatalog for a vintage.
+
+    The catalog file is VARIABLE_CATALOG_DIR/variables_<year>.pkl (default data/).
+    With CENSUS_DATA_SOURCE=warehouse it is offline: tables must have been
+    loaded along with the warehouse.
+    """
+    if year not in _catalogs:
+        directory = os.getenv('VARIABLE_CATALOG_DIR', 'data')
+        offline = os.getenv('CENSUS_DATA_SOURCE', 'api') == 'warehouse'
+        _catalogs[year] = VariableCatalog(os.path.join(directory, f'variables_{year}.pkl'), year=year, offline=offline)
+    return _catalogs[year]
+
+
+if __name__ == '__main__':
+    import sys
+
+    catalog = get_catalog(int(sys.argv[1]) if len(sys.argv) > 1 else 2023)
+    catalog.build()
+    print(f"Saved {len(catalog.tables)} tables to {catalog.path}")
@@ -0,0 +1,115 @@
+import os
+import json
+
+import numpy as np
+
+
+def _save(path, array):
+    # Several workers may build the same file; readers only ever see a whole one
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class VectorIndex:
+    """
+    In-memory cosine similarity search over the table embeddings.
+
+    The embedding matrix is normalized once and saved next to the original as
+    float32 (or int8 with a per-row scale when quantized), then memory-mapped,
+    so opening the index is cheap and pages are shared between processes. A
+    search is one matrix-vector product and an argpartition.
+
+    :param embeddings_path: .npy matrix with one embedding per table
+    :param tables_path: JSON list of tables, aligned with the embedding rows
+    :param quantized: Search an int8 copy of the matrix, using a quarter of the memory
+    """
+
+    def __init__(self, embeddings_path, tables_path, quantized=False):
+        with open(tables_path, 'r') as f:
+            self.tables = json.load(f)
+        self.quantized = quantized
+
+        base = embeddings_path[:-len('.npy')]
+        normalized_path = f'{base}.normalized.npy'
+        if not os.path.exists(normalized_path):
+            embeddings = np.load(embeddings_path, mmap_mode='r').astype(np.float32)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            _save(normalized_path, embeddings)
+
+        if quantized:
+            int8_path, scales_path = f'{base}.int8.npy', f'{base}.int8_scales.npy'
+            if not os.path.exists(int8_path):
+                embeddings = np.load(normalized_path, mmap_mode='r')
+                scales = np.maximum(np.abs(embeddings).max(axis=1), 1e-12) / 127
+                # scales first: the int8 file is what marks the copy as built
+                _save(scales_path, scales.astype(np.float32))
+                _save(int8_path, np.round(embeddings / scales[:, None]).astype(np.int8))
+            self.matrix = np.load(int8_path, mmap_mode='r')
+            self.scales = np.load(scales_path)
+        else:
+            self.matrix = np.load(normalized_path, mmap_mode='r')
+            self.scales = None
+
+        if len(self.matrix) != len(self.tables):
+            raise ValueError(f"{embeddings_path} has {len(self.matrix)} rows but {tables_path} has {len(self.tables)} tables")
+
+    def search(self, query_embedding, k=10):
+        """
+        Find the k tables closest to a query embedding.
+
+        :param query_embedding: 1-d embedding of the query
+        :param k: Number of results
+        :return: A list of dicts with name, description, variables, universe and score,
+            the same fields as the Atlas $vectorSearch pipeline (score in [0, 1])
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        if self.quantized:
+            # dequantize a block at a time so memory stays at the int8 footprint
+            scores = np.empty(len(self.matrix), dtype=np.float32)
+            for start in range(0, len(self.matrix), 8192):
+                block = self.matrix[start:start + 8192]
+                scores[start:start + len(block)] = block.astype(np.float32) @ query
+            scores *= self.scales
+        else:
+            scores = self.matrix @ query
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {
+                'name': self.tables[i].get('name'),
+                'description': self.tables[i].get('description'),
+                'variables': self.tables[i].get('variables'),
+                'universe': self.tables[i].get('universe'),
+                # Atlas reports cosine similarity rescaled to [0, 1]
+                'score': float((1 + scores[i]) / 2),
+            }
+            for i in top
+        ]
+
+
+_index = None
+
+
+def get_index():
+    """
+    Returns the process-wide VectorIndex over data/2023_table_embeddings.npy and
+    data/2023_tables.json (TABLE_EMBEDDINGS_PATH and TABLES_PATH override them).
+    TABLE_INDEX_QUANTIZED=1 selects the int8 index.
+    """
+    global _index
+    if _index is None:
+        _index = VectorIndex(
+            os.getenv('TABLE_EMBEDDINGS_PATH', 'data/2023_table_embeddings.npy'),
+            os.getenv('TABLES_PATH', 'data/2023_tables.json'),
+            quantized=os.getenv('TABLE_INDEX_QUANTIZED', '').lower() in ('1', 'true', 'yes'),
+        )
+    return _index
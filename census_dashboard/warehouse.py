@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from census_dashboard import http_client
+from census_dashboard.aggregation import GEO_COLUMNS
+from census_dashboard.variable_catalog import get_catalog
+
+
+class Warehouse:
+    """
+    Offline columnar store of ACS block group tables.
+
+    Each (vintage, table, state) is one Arrow IPC file,
+    <root>/<year>/<table>/<state>.arrow, with the rows sorted by GEOIDFQ and the
+    estimate and margin columns stored as float64. Files are memory-mapped, so a
+    query pages in only the columns and rows it reads, and rows are located by
+    binary search over the sorted GEOIDFQ column.
+
+    Parameters:
+    - root (str): Directory holding the Arrow files.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def path(self, year, table, state):
+        return os.path.join(self.root, str(year), table, f"{state}.arrow")
+
+    def _open(self, year, table, state):
+        """
+        Returns the memory-mapped table of a state and its sorted GEOIDFQ array,
+        or None if the state has not been loaded.
+        """
+        path = self.path(year, table, state)
+        with self._lock:
+            if path not in self._tables:
+                if not os.path.exists(path):
+                    return None
+                arrow_table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+                geoids = arrow_table.column('GEOIDFQ').to_numpy(zero_copy_only=False).astype(str)
+                self._tables[path] = (arrow_table, geoids)
+            return self._tables[path]
+
+    def write(self, year, table, rows):
+        """
+        Stores a table for one state from group() rows (dicts keyed by column).
+
+        Parameters:
+        - year (int): The ACS 5-year vintage.
+        - table (str): The table (group) code, e.g. B01001.
+        - rows (list): Block group rows, all from the same state.
+
+        Returns:
+        - str: Path of the Arrow file written.
+        """
+        frame = pd.DataFrame(rows)
+        frame['GEOIDFQ'] = frame['GEO_ID']
+        frame = frame.drop(columns=['ucgid'], errors='ignore').sort_values('GEOIDFQ', ignore_index=True)
+        for column in frame.columns:
+            if column not in GEO_COLUMNS and column != 'GEOIDFQ':
+                # estimates and margins as float64; annotation columns stay strings
+                if column.endswith(('E', 'M')):
+                    frame[column] = pd.to_numeric(frame[column], errors='coerce').astype(np.float64)
+                else:
+                    frame[column] = frame[column].astype('string')
+
+        state = frame['GEOIDFQ'].iloc[0][9:11]
+        path = self.path(year, table, state)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        arrow_table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._tables.pop(path, None)
+        return path
+
+    def states(self, year, table):
+        """
+        Returns the states loaded for a table.
+        """
+        directory = os.path.join(self.root, str(year), table)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f[:-len('.arrow')] for f in os.listdir(directory) if f.endswith('.arrow'))
+
+    def read(self, year, table, ucgids, columns=None):
+        """
+        Reads the rows of some block groups.
+
+        Parameters:
+        - year (int): The ACS 5-year vintage.
+        - table (str): The table (group) code, e.g. B01001.
+        - ucgids (list): GEOIDFQs of the block groups, without duplicates.
+        - columns (list): Columns to read (default all).
+
+        Returns:
+        - pd.DataFrame: Rows of the block groups found, indexed by GEOIDFQ.
+
+        Raises:
+        - KeyError: If a state of the requested block groups has not been loaded.
+        """
+        ucgids = np.asarray(list(ucgids), dtype=str)
+        states = np.array([ucgid[9:11] for ucgid in ucgids], dtype=str)
+        frames = []
+        for state in np.unique(states):
+            opened = self._open(year, table, state)
+            if opened is None:
+                raise KeyError(f"{table} ({year}) is not in the warehouse for state {state}")
+            arrow_table, geoids = opened
+            wanted = ucgids[states == state]
+            positions = np.searchsorted(geoids, wanted)
+            found = positions < len(geoids)
+            found[found] = geoids[positions[found]] == wanted[found]
+            selected = arrow_table if columns is None else arrow_table.select(['GEOIDFQ', *columns])
+            frames.append(selected.take(pa.array(positions[found])).to_pandas())
+
+        if not frames:
+            return pd.DataFrame(index=pd.Index([], name='GEOIDFQ'))
+        return pd.concat(frames, ignore_index=True).set_index('GEOIDFQ')
+
+
+def fetch_state(table, state, year):
+    """
+    Downloads a table for every block group of a state from the Census API.
+
+    Returns:
+    - list: Rows as dicts keyed by column.
+    """
+    api_url = os.getenv("CENSUS_API_URL", "https://api.census.gov/data")
+    params = {
+        "get": f"group({table})",
+        "ucgid": f"pseudo(0400000US{state}$1500000)",
+        "key": os.getenv("CENSUS_API_KEY"),
+    }
+    response = http_client.get(f"{api_url}/{year}/acs/acs5", params=params)
+    if response.status_code != 200:
+        raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+    return rows_from_response(response.json())
+
+
+def rows_from_response(data):
+    """
+    Converts a group() response (a header row followed by value rows) to dicts.
+    """
+    headers = data[0]
+    return [dict(zip(headers, values)) for values in data[1:]]
+
+
+def load(warehouse, tables, states, year):
+    """
+    Bulk-loads tables for whole states into the warehouse, one request per (table, state),
+    and their variable labels into the catalog, which warehouse mode never fetches.
+    """
+    catalog = get_catalog(year)
+    for table in tables:
+        if table not in catalog.tables:
+            catalog.fetch_group(table)
+    jobs = [(table, state) for table in tables for state in states]
+    executor = http_client.get_executor()
+    for (table, state), rows in zip(jobs, executor.map(lambda job: fetch_state(job[0], job[1], year), jobs)):
+        path = warehouse.write(year, table, rows)
+        print(f"Loaded {len(rows)} block groups of {table} ({year}) for state {state} into {path}")
+
+
+_warehouse = None
+
+
+def get_warehouse():
+    """
+    Returns the process-wide Warehouse in WAREHOUSE_DIR (default data/warehouse).
+    """
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = Warehouse(os.getenv("WAREHOUSE_DIR", "data/warehouse"))
+    return _warehouse
+
+
+if __name__ == '__main__':
+    # python -m census_dashboard.warehouse <year> <table,...> <state fips,...>
+    # python -m census_dashboard.warehouse <year> <table> --import <response.json | groups/<table>.json>...
+    year, tables = int(sys.argv[1]), sys.argv[2].split(',')
+    if sys.argv[3] == '--import':
+        for filename in sys.argv[4:]:
+            with open(filename) as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                catalog = get_catalog(year)
+                catalog.add_group(tables[0], data)
+                catalog.save()
+                print(f"Imported the labels of {tables[0]} from {filename} into {catalog.path}")
+                continue
+            path = get_warehouse().write(year, tables[0], rows_from_response(data))
+            print(f"Imported {filename} into {path}")
+    else:
+        load(get_warehouse(), tables, sys.argv[3].split(','), year)
@@ -9,5 +9,6 @@ setup(
     version='0.1.0',
     packages=find_packages(),  # This should detect 'census_dashboard'
     include_package_data=True,
+    package_data={'census_dashboard': ['assets/*']},
     install_requires=parse_requirements('requirements.txt')
 )
\ No newline at end of file
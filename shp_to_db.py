@@ -1,19 +1,33 @@
 import os
 import sys
 import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dotenv import load_dotenv
 load_dotenv()
 import shapefile  # pyshp library
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
+from shapely.geometry import mapping, shape
 
-def convert_shp_to_geojson(shp_file_path):
-    """Convert a shapefile (.shp) to GeoJSON."""
+from census_dashboard.display import display_geometry
+
+BATCH_SIZE = int(os.getenv('SHP_BATCH_SIZE', '1000'))
+UPSERT_KEY = "GEOIDFQ"
+
+def iter_shp_features(shp_file_path, with_display=False):
+    """
+    Lazily yield the GeoJSON features of a shapefile (.shp), one record at a time.
+
+    With with_display, each feature also gets a simplified, coordinate-quantized
+    display_geometry next to its exact geometry.
+    """
     with shapefile.Reader(shp_file_path) as shp:
         fields = shp.fields[1:]  # First field is a delete flag
         field_names = [field[0] for field in fields]
-        
-        geojson_features = []
-        for sr in shp.shapeRecords():
+
+        for sr in shp.iterShapeRecords():
             attributes = sr.record.as_dict()
             geom = sr.shape.__geo_interface__
             feature = {
@@ -21,23 +35,133 @@ def convert_shp_to_geojson(shp_file_path):
                 "geometry": geom,
                 "properties": {name: attributes[name] for name in field_names}
             }
-            geojson_features.append(feature)
+            if with_display:
+                # Light shape for the map; the exact geometry stays for overlap math
+                feature["display_geometry"] = mapping(display_geometry(shape(geom)))
+            yield feature
 
-    geojson = {
+def convert_shp_to_geojson(shp_file_path):
+    """Convert a shapefile (.shp) to GeoJSON."""
+    return {
         "type": "FeatureCollection",
-        "features": geojson_features
+        "features": list(iter_shp_features(shp_file_path))
     }
-    
-    return geojson
+
+def batched(iterable, batch_size):
+    """Yield lists of up to batch_size items from an iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest_shapefile(collection, shapefile_path, batch_size=BATCH_SIZE, upsert_key=None, verbose=True):
+    """
+    Stream a shapefile into a collection in fixed-size unordered batches.
+
+    Only one batch is held in memory at a time. With upsert_key, each feature
+    replaces the document with the same properties.<upsert_key>, so re-ingesting
+    a file does not create duplicates. Returns the number of ingested features.
+    """
+    ingested = 0
+    start = time.perf_counter()
+    for batch in batched(iter_shp_features(shapefile_path, with_display=True), batch_size):
+        if upsert_key:
+            collection.bulk_write(
+                [ReplaceOne({f"properties.{upsert_key}": f["properties"][upsert_key]}, f, upsert=True) for f in batch],
+                ordered=False,
+            )
+        else:
+            collection.insert_many(batch, ordered=False)
+        ingested += len(batch)
+        if verbose:
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            print(f"  {ingested} features, {ingested / elapsed:.0f} features/s", end="\r", flush=True)
+    if verbose:
+        print()
+    return ingested
+
+def file_checksum(shapefile_path):
+    """SHA-256 of a shapefile's geometry (.shp) and attribute (.dbf) files."""
+    digest = hashlib.sha256()
+    for path in (shapefile_path, shapefile_path[:-len(".shp")] + ".dbf"):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {"files": {}}
+
+def save_manifest(manifest, manifest_path):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def find_duplicates(collection, key=UPSERT_KEY):
+    """Yield (key value, document ids) for every properties.<key> held by more than one document."""
+    pipeline = [
+        {"$group": {"_id": f"$properties.{key}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    for group in collection.aggregate(pipeline, allowDiskUse=True):
+        yield group["_id"], group["ids"]
+
+def has_unique_index(collection, key=UPSERT_KEY):
+    return any(
+        index.get("unique") and index["key"] == [(f"properties.{key}", 1)]
+        for index in collection.index_information().values()
+    )
+
+def drop_2dsphere_indexes(collection):
+    """Drop every 2dsphere index so bulk writes do not maintain it. Returns the names dropped."""
+    dropped = []
+    for name, index in collection.index_information().items():
+        if any(kind == "2dsphere" for _, kind in index["key"]):
+            collection.drop_index(name)
+            dropped.append(name)
+    return dropped
+
+def remove_duplicates(collection, key=UPSERT_KEY):
+    """Delete all but the most recently inserted document for each duplicated properties.<key>. Returns the number deleted."""
+    removed = 0
+    for _, ids in find_duplicates(collection, key):
+        extra = sorted(ids)[:-1]
+        removed += collection.delete_many({"_id": {"$in": extra}}).deleted_count
+    return removed
+
+def _ingest_file(mongo_conn_str, database_name, collection_name, shapefile_path, batch_size):
+    """Process pool worker: ingest one shapefile over its own connection."""
+    start = time.perf_counter()
+    with MongoClient(mongo_conn_str) as client:
+        collection = client[database_name][collection_name]
+        count = ingest_shapefile(collection, shapefile_path, batch_size, upsert_key=UPSERT_KEY, verbose=False)
+    return count, time.perf_counter() - start
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python script.py <directory_path> <database_name> <collection_name>")
-        sys.exit(1)
-        
-    directory_path = sys.argv[1]
-    database_name = sys.argv[2]
-    collection_name = sys.argv[3]
+    parser = argparse.ArgumentParser(description="Ingest a directory of shapefiles into a MongoDB collection.")
+    parser.add_argument("directory_path")
+    parser.add_argument("database_name")
+    parser.add_argument("collection_name")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parallel worker processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--remove-duplicates", action="store_true",
+                        help=f"delete all but the newest document for each duplicated properties.{UPSERT_KEY} before loading")
+    parser.add_argument("--manifest", help="manifest of ingested files (default: <directory>/.ingest-<database>-<collection>.json)")
+    args = parser.parse_args()
+
+    directory_path = args.directory_path
+    database_name = args.database_name
+    collection_name = args.collection_name
+    manifest_path = args.manifest or os.path.join(directory_path, f".ingest-{database_name}-{collection_name}.json")
 
     # Load MongoDB connection string from an environment variable
     mongo_conn_str = os.getenv('MONGODB_URI')
@@ -50,17 +174,86 @@ def main():
     db = client[database_name]
     collection = db[collection_name]
 
-    # Iterate over all .shp files in the directory
-    for filename in os.listdir(directory_path):
+    # Collections loaded by older versions of this script may hold the same block group twice
+    if not has_unique_index(collection):
+        if args.remove_duplicates:
+            removed = remove_duplicates(collection)
+            if removed:
+                print(f"Removed {removed} duplicate documents from {database_name}.{collection_name}.")
+        else:
+            duplicates = sum(1 for _ in find_duplicates(collection))
+            if duplicates:
+                print(f"Error: {duplicates} {UPSERT_KEY} values appear in more than one document of "
+                      f"{database_name}.{collection_name}, so the unique index cannot be built. "
+                      f"Re-run with --remove-duplicates to keep only the newest document for each.")
+                sys.exit(1)
+
+    # Upserts look documents up by key; the 2dsphere index is only built once the load is done
+    collection.create_index(f"properties.{UPSERT_KEY}", unique=True)
+
+    # Skip files the manifest says were already ingested with the same contents
+    manifest = load_manifest(manifest_path)
+    pending = {}
+    for filename in sorted(os.listdir(directory_path)):
         if filename.endswith(".shp"):
-            shapefile_path = os.path.join(directory_path, filename)
-            # Convert the shapefile to GeoJSON
-            print(shapefile_path)
-            geojson_data = convert_shp_to_geojson(shapefile_path)
-            # Insert GeoJSON features into the collection
-            if geojson_data["features"]:
-                collection.insert_many(geojson_data["features"])
-                print(f"Inserted {len(geojson_data['features'])} features from {filename} into {database_name}.{collection_name}.")
+            checksum = file_checksum(os.path.join(directory_path, filename))
+            entry = manifest["files"].get(filename)
+            if entry and entry["checksum"] == checksum:
+                print(f"Skipping {filename}: already ingested ({entry['features']} features).")
+            else:
+                pending[filename] = checksum
+
+    # The 2dsphere index is built once, after every file is in; a resumed run drops it first
+    if pending:
+        for name in drop_2dsphere_indexes(collection):
+            print(f"Dropped 2dsphere index {name} until the load is done.")
+
+    total = 0
+    failed = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {
+            executor.submit(
+                _ingest_file, mongo_conn_str, database_name, collection_name,
+                os.path.join(directory_path, filename), args.batch_size
+            ): filename
+            for filename in pending
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                count, seconds = future.result()
+            except Exception as e:
+                # No checksum, so the next run retries the file
+                failed.append(filename)
+                manifest["files"][filename] = {
+                    "checksum": None,
+                    "error": f"{type(e).__name__}: {e}",
+                    "failed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                save_manifest(manifest, manifest_path)
+                print(f"Failed to ingest {filename}: {e}")
+                continue
+            total += count
+            manifest["files"][filename] = {
+                "checksum": pending[filename],
+                "features": count,
+                "seconds": round(seconds, 3),
+                "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            save_manifest(manifest, manifest_path)
+            print(f"Ingested {count} features from {filename} into {database_name}.{collection_name} ({count / max(seconds, 1e-9):.0f} features/s).")
+
+    rate = total / max(time.perf_counter() - start, 1e-9)
+    print(f"Ingested {total} features in total ({rate:.0f} features/s).")
+
+    if failed:
+        print(f"Error: {len(failed)} files failed and will be retried on the next run: {', '.join(sorted(failed))}")
+        print("The 2dsphere index will be created once every file is ingested.")
+        sys.exit(1)
+
+    print("Creating 2dsphere index on geometry...")
+    collection.create_index([("geometry", "2dsphere")])
 
 if __name__ == "__main__":
     main()